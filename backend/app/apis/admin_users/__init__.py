@@ -20,7 +20,8 @@ class UserListItem(BaseModel):
 
 class UserListResponse(BaseModel):
     users: List[UserListItem]
-    total: int
+    total: Optional[int] = None  # not counted for cursor pages after the first
+    nextCursor: Optional[str] = None
 
 class UpdateUserStatusRequest(BaseModel):
     status: str  # active, inactive, blocked
@@ -35,30 +36,31 @@ def get_all_users(
     role: Optional[str] = Query(None, description="Filter by user role"),
     status: Optional[str] = Query(None, description="Filter by user status"),
     page: int = Query(1, ge=1),
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor: empty for the first page, then the previous page's nextCursor; replaces page")
 ) -> UserListResponse:
     """Get all users with optional filtering and pagination"""
-    # Get all users
-    all_users = users_db.get_all()
-    
-    # Filter by role if provided
+    # Role and status filters are answered from indexes, only the page is sorted out
+    where = {}
     if role:
-        all_users = [user for user in all_users if user.get("role") == role]
-    
-    # Filter by status if provided
+        where["role"] = role
     if status:
-        all_users = [user for user in all_users if user.get("status") == status]
-    
-    # Sort by creation date (newest first)
-    all_users.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
+        where["status"] = status
     
-    # Calculate pagination
-    total = len(all_users)
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    
-    # Get paginated users
-    paginated_users = all_users[start_idx:end_idx]
+    try:
+        result = users_db.select(
+            where=where,
+            sort_by="createdAt",
+            descending=True,
+            offset=(page - 1) * limit,
+            limit=limit,
+            count=not cursor,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = result.total
+    paginated_users = result.items
     
     # Convert to response format (exclude password hash)
     user_list = []
@@ -77,7 +79,8 @@ def get_all_users(
     
     return UserListResponse(
         users=user_list,
-        total=total
+        total=total,
+        nextCursor=result.next_cursor
     )
 
 @router.put("/admin/users/{user_id}/status", response_model=UpdateUserStatusResponse)
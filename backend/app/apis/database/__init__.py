@@ -1,93 +1,1439 @@
-import databutton as db
+import atexit
+import base64
+import bisect
+import hashlib
+import heapq
+import itertools
 import json
+import math
 import re
+import threading
+import time
+from contextlib import contextmanager
 import uuid
-from datetime import datetime
-from typing import List, Dict, Any, Optional, TypeVar, Generic
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, TypeVar, Generic, Callable, Iterable, NamedTuple, Set, Tuple, Union
 from fastapi import APIRouter
 
-# Create an empty router with tags to make it clear this is a utility module, not an API
+# Optional NumPy columnar snapshots; collections plan queries over their other indexes without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from app.apis.storage import (
+    CollectionStore, GenerationConflict, get_storage_backend, replay_log_records, apply_increments,
+    sanitize_storage_key, LOG_MODE, SNAPSHOT_MODE, JSON_CODEC, ORJSON_CODEC, MSGPACK_CODEC,
+    NO_COMPRESSION, GZIP_COMPRESSION, ZSTD_COMPRESSION
+)
+
+# Utility module - the router only exposes internal diagnostics, not data endpoints
 router = APIRouter(tags=["database-utils"])
 
 # Type variable for database operations
 T = TypeVar('T')
 
-# Sanitize storage key to only allow alphanumeric and ._- symbols
-def sanitize_storage_key(key: str) -> str:
-    """Sanitize storage key to only allow alphanumeric and ._- symbols"""
-    return re.sub(r'[^a-zA-Z0-9._-]', '', key)
+# Normalize an email address for case-insensitive matching
+def normalize_email(email: Any) -> str:
+    """Normalize an email address for case-insensitive matching"""
+    return str(email or '').strip().lower()
+
+# Get the product an order item refers to
+def order_item_product_id(item: Any) -> Optional[str]:
+    """Get the product ID of an order item (id, or productId in older orders)"""
+    if not isinstance(item, dict):
+        return None
+    return item.get('productId') or item.get('id')
+
+# Get the normalized email an order belongs to
+def order_email(order: Dict[str, Any]) -> str:
+    """Get the normalized customer email of an order, from wherever legacy orders kept it"""
+    for holder in (order.get('shippingInfo'), order, order.get('customer'), order.get('user')):
+        if isinstance(holder, dict) and holder.get('email'):
+            return normalize_email(holder['email'])
+    return ''
+
+# Number of log records after which a log-mode collection is compacted in the background
+LOG_COMPACTION_THRESHOLD = 200
+
+# Number of times a write is re-applied on fresh data after a generation conflict
+MAX_WRITE_RETRIES = 5
+
+# Seconds increments are held in memory and coalesced before they are persisted in one write
+COUNTER_FLUSH_INTERVAL = 1.0
+
+# Age after which the order counters are recounted from the orders, healing any drift
+ORDER_STATS_RECOUNT_INTERVAL = timedelta(minutes=15)
+
+class CollectionWriteError(Exception):
+    """Raised when a unit of work cannot be committed to storage"""
+    pass
+
+class QueryResult(NamedTuple):
+    """Page of documents returned by Collection.select"""
+    items: List[Dict[str, Any]]
+    total: Optional[int]  # number of matching documents, None when not counted
+    next_cursor: Optional[str] = None  # cursor of the following page in cursor mode, None on the last page
+
+class FacetCounts(NamedTuple):
+    """Facet value counts returned by Collection.facet_counts"""
+    counts: Dict[str, Dict[Any, int]]  # facet name -> value -> number of documents
+    total: int  # number of documents counted
+
+class _Highest:
+    """Sentinel that sorts after any document ID, for bisecting (key, id) entries"""
+    def __lt__(self, other):
+        return False
+    
+    def __gt__(self, other):
+        return True
+
+_HIGHEST = _Highest()
+
+# Words of searchable text (Unicode aware, so Ge'ez script is tokenized too)
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def tokenize(text: Any) -> List[str]:
+    """Split text into lowercase search terms"""
+    return TOKEN_PATTERN.findall(str(text).lower()) if text else []
+
+# Contact details as typed into order lookups: emails, phone numbers (with separators) and words
+CONTACT_TOKEN_PATTERN = re.compile(r'(?P<email>[\w.+-]+@[\w.-]*\w)|(?P<phone>\+?\d[\d\s().-]*\d)|(?P<word>\w+)')
+
+def contact_tokenize(text: Any) -> List[str]:
+    """Split text into lowercase search terms, keeping emails whole and phone numbers as their digits"""
+    terms = []
+    for match in CONTACT_TOKEN_PATTERN.finditer(str(text).lower() if text else ''):
+        if match.group('phone'):
+            terms.append(re.sub(r'\D', '', match.group('phone')))
+        else:
+            terms.append(match.group())
+    return terms
+
+class TextIndex:
+    """Inverted full-text index over weighted fields, keyed by document ID
+
+    Each term maps to the documents containing it with a weight of
+    sum(field boost * (1 + log(term frequency in field))). Queries match documents
+    containing every query term, the last one as a prefix (search as you type),
+    and rank them by sum(weight * idf).
+    """
+    def __init__(self, fields: Dict[str, float]):
+        self.fields = fields
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.doc_terms: Dict[str, Dict[str, float]] = {}
+        self.vocabulary: List[str] = []  # sorted terms, for prefix lookups
+    
+    def add(self, id: str, doc: Dict[str, Any]) -> None:
+        """Index a document's fields"""
+        self.remove(id)
+        terms: Dict[str, float] = {}
+        for field, boost in self.fields.items():
+            counts: Dict[str, int] = {}
+            for term in tokenize(doc.get(field)):
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                terms[term] = terms.get(term, 0.0) + boost * (1 + math.log(tf))
+        for term, weight in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                bisect.insort(self.vocabulary, term)
+            posting[id] = weight
+        if terms:
+            self.doc_terms[id] = terms
+    
+    def remove(self, id: str) -> None:
+        """Drop a document from the index"""
+        for term in self.doc_terms.pop(id, {}):
+            posting = self.postings[term]
+            del posting[id]
+            if not posting:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+    
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + '\U0010ffff')
+        return self.vocabulary[start:end]
+    
+    def search(self, query: str) -> Dict[str, float]:
+        """Score the documents matching every term of a query; {} for an empty query"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return {}
+        total_docs = len(self.doc_terms) or 1
+        scores: Optional[Dict[str, float]] = None
+        for i, term in enumerate(terms):
+            expansions = self._prefix_terms(term) if i == len(terms) - 1 else [term]
+            term_scores: Dict[str, float] = {}
+            for expansion in expansions:
+                posting = self.postings.get(expansion)
+                if not posting:
+                    continue
+                idf = math.log(1 + total_docs / len(posting))
+                for id, weight in posting.items():
+                    # Several expansions of the prefix count once, by the best one
+                    term_scores[id] = max(term_scores.get(id, 0.0), weight * idf)
+            if not term_scores:
+                # A term no document has, so no document has them all
+                return {}
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {id: score + term_scores[id] for id, score in scores.items() if id in term_scores}
+            if not scores:
+                return {}
+        return scores
+
+# Similarity a word must reach to count as a fuzzy match of a query term (pg_trgm's default)
+TRIGRAM_THRESHOLD = 0.3
+
+# Digits of a phone number that must agree, counted from the end (an Ethiopian subscriber
+# number is 9 digits, so 0911 223 344 and +251 911 223 344 match); shorter numbers match whole
+PHONE_MATCH_DIGITS = 9
+PHONE_MIN_DIGITS = 7
+
+def trigrams(word: str) -> Set[str]:
+    """Get the trigrams of a word, padded so that its start and end weigh in"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def is_phone_number(word: str) -> bool:
+    """Check whether a search word is a phone number (digits only, long enough)"""
+    return len(word) >= PHONE_MIN_DIGITS and word.isdigit()
+
+class TrigramIndex:
+    """Typo-tolerant word index over computed fields, keyed by document ID
+
+    Every word of the fields is indexed by its trigrams. A query term is compared
+    only with the words sharing a trigram with it, scored by the Jaccard similarity
+    of their trigram sets ("teff"/"tef" 0.5, "injera"/"enjera" 0.4), and words
+    below the threshold are ignored. A document scores the mean, over the query
+    terms, of its best word similarity, and matches when that reaches the threshold.
+    Emails only match whole: their shared domain would make every address similar.
+    Numbers of PHONE_MIN_DIGITS or more digits match numbers ending in the same
+    PHONE_MATCH_DIGITS digits, so a local and an international form agree; digits
+    have too few trigrams to tell numbers apart.
+    """
+    def __init__(self, fields: Dict[str, Callable[[Dict[str, Any]], Any]], threshold: float = TRIGRAM_THRESHOLD,
+                 tokenizer: Callable[[Any], List[str]] = tokenize):
+        self.fields = fields
+        self.threshold = threshold
+        self.tokenizer = tokenizer
+        self.word_docs: Dict[str, Set[str]] = {}
+        self.doc_words: Dict[str, Set[str]] = {}
+        self.trigram_words: Dict[str, Set[str]] = {}
+        # Last PHONE_MIN_DIGITS digits -> the phone-like words ending in them
+        self.phone_words: Dict[str, Set[str]] = {}
+    
+    def add(self, id: str, doc: Dict[str, Any]) -> None:
+        """Index the words of a document's fields"""
+        self.remove(id)
+        words = set()
+        for field_fn in self.fields.values():
+            try:
+                words.update(self.tokenizer(field_fn(doc)))
+            except Exception:
+                continue
+        for word in words:
+            docs = self.word_docs.get(word)
+            if docs is None:
+                docs = self.word_docs[word] = set()
+                if is_phone_number(word):
+                    self.phone_words.setdefault(word[-PHONE_MIN_DIGITS:], set()).add(word)
+                for trigram in trigrams(word):
+                    self.trigram_words.setdefault(trigram, set()).add(word)
+            docs.add(id)
+        if words:
+            self.doc_words[id] = words
+    
+    def remove(self, id: str) -> None:
+        """Drop a document from the index"""
+        for word in self.doc_words.pop(id, ()):
+            docs = self.word_docs[word]
+            docs.discard(id)
+            if not docs:
+                del self.word_docs[word]
+                if is_phone_number(word):
+                    words = self.phone_words[word[-PHONE_MIN_DIGITS:]]
+                    words.discard(word)
+                    if not words:
+                        del self.phone_words[word[-PHONE_MIN_DIGITS:]]
+                for trigram in trigrams(word):
+                    words = self.trigram_words[trigram]
+                    words.discard(word)
+                    if not words:
+                        del self.trigram_words[trigram]
+    
+    def similar_words(self, term: str) -> Dict[str, float]:
+        """Get the indexed words similar to a term, with their similarity"""
+        if '@' in term:
+            return {term: 1.0} if term in self.word_docs else {}
+        if is_phone_number(term):
+            digits = min(len(term), PHONE_MATCH_DIGITS)
+            return {word: 1.0 for word in self.phone_words.get(term[-PHONE_MIN_DIGITS:], ())
+                    if word[-digits:] == term[-digits:]}
+        term_trigrams = trigrams(term)
+        shared: Dict[str, int] = {}
+        for trigram in term_trigrams:
+            for word in self.trigram_words.get(trigram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        similar = {}
+        for word, count in shared.items():
+            similarity = count / (len(term_trigrams) + len(trigrams(word)) - count)
+            if similarity >= self.threshold:
+                similar[word] = similarity
+        return similar
+    
+    def search(self, query: str) -> Dict[str, float]:
+        """Score the documents fuzzily matching a query; {} for an empty query"""
+        terms = list(dict.fromkeys(self.tokenizer(query)))
+        if not terms:
+            return {}
+        totals: Dict[str, float] = {}
+        for term in terms:
+            best: Dict[str, float] = {}
+            for word, similarity in self.similar_words(term).items():
+                for id in self.word_docs[word]:
+                    if similarity > best.get(id, 0.0):
+                        best[id] = similarity
+            for id, similarity in best.items():
+                totals[id] = totals.get(id, 0.0) + similarity
+        return {id: total / len(terms) for id, total in totals.items() if total / len(terms) >= self.threshold}
+
+# Column kinds of a ColumnarIndex
+NUMERIC_COLUMN = "numeric"
+TEXT_COLUMN = "text"
+CATEGORICAL_COLUMN = "categorical"
+
+# Initial row capacity of a ColumnarIndex; doubled whenever it fills up
+COLUMNAR_INITIAL_CAPACITY = 1024
+
+class ColumnarIndex:
+    """NumPy snapshot of selected document fields, one row per document ID
+
+    Numeric columns are float64 (NaN for missing or non-numeric values), text
+    columns fixed-width unicode, and categorical columns int32 codes into a
+    per-column dictionary of values (-1 when missing). The arrays keep spare
+    capacity, so adding a document appends its row in amortized O(1) and updating
+    one rewrites its row in place. Removing a document only flags its row dead (an
+    ID that comes back reuses the row); the arrays are compacted once dead rows
+    outnumber live ones.
+    """
+    def __init__(self, columns: Dict[str, Tuple[str, Callable[[Dict[str, Any]], Any]]]):
+        self.columns = columns
+        self.size = 0
+        self.live_rows = 0
+        self.rows: Dict[str, int] = {}
+        self.codes: Dict[str, Dict[Any, int]] = {
+            name: {} for name, (kind, _) in columns.items() if kind == CATEGORICAL_COLUMN}
+        self.ids = np.empty(COLUMNAR_INITIAL_CAPACITY, dtype='U1')
+        self.alive = np.zeros(COLUMNAR_INITIAL_CAPACITY, dtype=bool)
+        self.arrays = {name: self._empty(kind, COLUMNAR_INITIAL_CAPACITY) for name, (kind, _) in columns.items()}
+    
+    @staticmethod
+    def _empty(kind: str, capacity: int):
+        if kind == NUMERIC_COLUMN:
+            return np.full(capacity, np.nan)
+        if kind == CATEGORICAL_COLUMN:
+            return np.full(capacity, -1, dtype=np.int32)
+        return np.empty(capacity, dtype='U1')
+    
+    @staticmethod
+    def _put_text(array, row: int, value: str):
+        """Store a string, widening the array first if it is too narrow; returns the array"""
+        if len(value) > array.dtype.itemsize // 4:
+            array = array.astype(f'U{max(len(value), 2 * (array.dtype.itemsize // 4))}')
+        array[row] = value
+        return array
+    
+    def _grow(self) -> None:
+        capacity = len(self.alive)
+        self.ids = np.concatenate([self.ids, np.empty(capacity, dtype=self.ids.dtype)])
+        self.alive = np.concatenate([self.alive, np.zeros(capacity, dtype=bool)])
+        for name, (kind, _) in self.columns.items():
+            self.arrays[name] = np.concatenate([self.arrays[name], self._empty(kind, capacity).astype(self.arrays[name].dtype)])
+    
+    def add(self, id: str, doc: Dict[str, Any]) -> None:
+        """Write a document's row, appending one if its ID has none"""
+        row = self.rows.get(id)
+        if row is None:
+            if self.size == len(self.alive):
+                self._grow()
+            row = self.rows[id] = self.size
+            self.size += 1
+            self.ids = self._put_text(self.ids, row, id)
+        if not self.alive[row]:
+            self.alive[row] = True
+            self.live_rows += 1
+        for name, (kind, value_fn) in self.columns.items():
+            try:
+                value = value_fn(doc)
+            except Exception:
+                value = None
+            if kind == NUMERIC_COLUMN:
+                try:
+                    self.arrays[name][row] = float(value)
+                except (TypeError, ValueError):
+                    self.arrays[name][row] = np.nan
+            elif kind == CATEGORICAL_COLUMN:
+                try:
+                    codes = self.codes[name]
+                    self.arrays[name][row] = -1 if value is None else codes.setdefault(value, len(codes))
+                except TypeError:
+                    self.arrays[name][row] = -1
+            else:
+                self.arrays[name] = self._put_text(self.arrays[name], row, '' if value is None else str(value))
+    
+    def remove(self, id: str) -> None:
+        """Flag a document's row dead, compacting the arrays when too many are"""
+        row = self.rows.get(id)
+        if row is None or not self.alive[row]:
+            return
+        self.alive[row] = False
+        self.live_rows -= 1
+        if self.size - self.live_rows > max(self.live_rows, COLUMNAR_INITIAL_CAPACITY):
+            self._compact()
+    
+    def _compact(self) -> None:
+        """Drop dead rows, keeping the live ones in order"""
+        keep = np.flatnonzero(self.alive[:self.size])
+        capacity = max(COLUMNAR_INITIAL_CAPACITY, 2 * len(keep))
+        def packed(array, fill):
+            compacted = np.full(capacity, fill, dtype=array.dtype)
+            compacted[:len(keep)] = array[keep]
+            return compacted
+        self.ids = packed(self.ids, '')
+        self.alive = packed(self.alive, False)
+        for name, (kind, _) in self.columns.items():
+            fill = np.nan if kind == NUMERIC_COLUMN else -1 if kind == CATEGORICAL_COLUMN else ''
+            self.arrays[name] = packed(self.arrays[name], fill)
+        self.size = len(keep)
+        self.rows = {str(id): row for row, id in enumerate(self.ids[:self.size])}
+    
+    def select(self, where: Dict[str, Any], ranges: Dict[str, Tuple[Any, Any]], sort_by: Optional[str],
+               descending: bool, offset: int, limit: Optional[int], count: bool) -> Tuple[List[str], Optional[int]]:
+        """Get the IDs of one page of rows matching equality and inclusive range filters, and their count
+
+        Filters are combined as boolean masks. A sort orders the matches by (column
+        value, id) with lexsort, like a sorted index; otherwise rows come in the
+        order their IDs were first added.
+        """
+        size = self.size
+        mask = self.alive[:size].copy()
+        for name, value in where.items():
+            code = self.codes[name].get(value)
+            if code is None:
+                return [], 0 if count else None
+            mask &= self.arrays[name][:size] == code
+        for name, (low, high) in ranges.items():
+            column = self.arrays[name][:size]
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        rows = np.flatnonzero(mask)
+        total = len(rows) if count else None
+        if sort_by is not None:
+            order = np.lexsort((self.ids[rows], self.arrays[sort_by][rows]))
+            rows = rows[order[::-1] if descending else order]
+        end = None if limit is None else offset + limit
+        return [str(id) for id in self.ids[rows[offset:end]]], total
+
+class FacetIndex:
+    """Value counts of computed facets over the documents, keyed by document ID
+
+    Each document's facet values are kept alongside facet -> value -> count, so a
+    write only moves the counts of the documents it touches and the counts of the
+    whole collection are read in O(facet values).
+    """
+    def __init__(self, facets: Dict[str, Callable[[Dict[str, Any]], Any]]):
+        self.facets = facets
+        self.counts: Dict[str, Dict[Any, int]] = {name: {} for name in facets}
+        self.doc_values: Dict[str, Dict[str, Any]] = {}
+    
+    def _values(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Compute the facet values of a document, skipping unusable ones"""
+        values = {}
+        for name, value_fn in self.facets.items():
+            try:
+                value = value_fn(doc)
+                hash(value)
+            except Exception:
+                continue
+            if value is not None:
+                values[name] = value
+        return values
+    
+    def add(self, id: str, doc: Dict[str, Any]) -> None:
+        """Count a document's facet values"""
+        self.remove(id)
+        values = self._values(doc)
+        for name, value in values.items():
+            self.counts[name][value] = self.counts[name].get(value, 0) + 1
+        self.doc_values[id] = values
+    
+    def remove(self, id: str) -> None:
+        """Stop counting a document"""
+        for name, value in self.doc_values.pop(id, {}).items():
+            counts = self.counts[name]
+            counts[value] -= 1
+            if not counts[value]:
+                del counts[value]
+    
+    def tally(self, ids: List[str]) -> Dict[str, Dict[Any, int]]:
+        """Count the facet values of some of the documents"""
+        counts: Dict[str, Dict[Any, int]] = {name: {} for name in self.facets}
+        for id in ids:
+            for name, value in self.doc_values.get(id, {}).items():
+                counts[name][value] = counts[name].get(value, 0) + 1
+        return counts
+
+# Opaque keyset pagination cursors: the sort order and (sort key, id) of the last document of a page
+def encode_cursor(sort_by: str, key: Any, id: str) -> str:
+    """Encode a sort order name, sort key and document ID as an opaque cursor token"""
+    return base64.urlsafe_b64encode(json.dumps([sort_by, key, id]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_by: str) -> Tuple[Any, str]:
+    """Decode a cursor token for a sort order; raises ValueError if it is malformed or from another sort order"""
+    try:
+        cursor_sort, key, id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort_by or not isinstance(id, str):
+        raise ValueError("Invalid cursor")
+    return key, id
+
+# Registry of instantiated collections, used for cache diagnostics
+_collections: Dict[str, "Collection"] = {}
 
 # Database collections
 class Collection(Generic[T]):
-    """Base class for database collections"""
-    def __init__(self, collection_name: str):
+    """Base class for database collections: cached documents over a CollectionStore
+
+    collection_name is the storage key. storage_mode is SNAPSHOT_MODE, or LOG_MODE to
+    append each change to a log that is compacted into the snapshot. codec
+    (JSON_CODEC, ORJSON_CODEC or MSGPACK_CODEC) and compression (NO_COMPRESSION,
+    GZIP_COMPRESSION or ZSTD_COMPRESSION) set how snapshots are written. columnar
+    keeps a NumPy ColumnarIndex of `columns` for select() when NumPy is installed.
+    See backend/README.md for how caching, indexes and concurrent writes work.
+    """
+    # Secondary indexes: index name -> function returning a document's key
+    indexes: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+    # Multi-key indexes: index name -> function returning every key of a document
+    multi_indexes: Dict[str, Callable[[Dict[str, Any]], Iterable[Any]]] = {}
+    # Fields of the full-text index and their relevance boosts; no text index when empty
+    text_fields: Dict[str, float] = {}
+    # Fields of the trigram index: name -> function returning a document's text; no trigram index when empty
+    fuzzy_fields: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+    # Splits fuzzy_fields and fuzzy queries into words
+    fuzzy_tokenizer = staticmethod(tokenize)
+    # Named sort orders for select(): sort name -> function returning a document's sort key
+    sort_keys: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+    # Facets counted by facet_counts(): facet name -> function returning a document's value
+    facets: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+    # Columns of the optional NumPy snapshot: name -> (column kind, function returning a document's value).
+    # Categorical columns answer where= filters of the same name, the others ranges= and sort_by=.
+    columns: Dict[str, Tuple[str, Callable[[Dict[str, Any]], Any]]] = {}
+    
+    def __init__(self, collection_name: str, storage_mode: str = SNAPSHOT_MODE, codec: str = JSON_CODEC,
+                 compression: str = NO_COMPRESSION, columnar: bool = False):
         self.collection_name = sanitize_storage_key(collection_name)
+        self.storage_mode = storage_mode
+        if columnar and np is None:
+            print(f"NumPy is not installed, {self.collection_name} is queried without a columnar snapshot")
+        self.columnar = columnar and np is not None and bool(self.columns)
+        self._store: CollectionStore = get_storage_backend().open(
+            self.collection_name, storage_mode, codec, compression)
+        self.compaction_threshold = LOG_COMPACTION_THRESHOLD
+        self._lock = threading.RLock()
+        self._cache: Optional[List[Dict[str, Any]]] = None
+        self._generation: Optional[str] = None
+        self._id_index: Optional[Dict[str, int]] = None
+        self._field_indexes: Optional[Dict[str, Dict[Any, List[int]]]] = None
+        self._sorted_indexes: Dict[str, List[Tuple[Any, str]]] = {}
+        self._text_index: Optional[TextIndex] = None
+        self._trigram_index: Optional[TrigramIndex] = None
+        self._columnar_index: Optional[ColumnarIndex] = None
+        self._facet_index: Optional[FacetIndex] = None
+        self._multi_index: Optional[Dict[str, Dict[Any, Set[str]]]] = None
+        self._compacting = False
+        self._uow_depth = 0
+        self._uow_records: Optional[List[Dict[str, Any]]] = []
+        self._pending_increments: Dict[str, Dict[str, Any]] = {}
+        self._flush_timer: Optional[threading.Timer] = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        _collections[self.collection_name] = self
     
-    def get_all(self) -> List[Dict[str, Any]]:
-        """Get all documents in the collection"""
+    def _read_generation(self) -> str:
+        """Read the generation token of the stored collection"""
         try:
-            data_json = db.storage.text.get(self.collection_name, default="[]")
-            data = json.loads(data_json)
-            # Validate image URLs to ensure they're not undefined or empty
-            if self.collection_name == 'products':
-                for product in data:
-                    if 'images' in product and not product['images']:
-                        product['images'] = []
-                    elif 'images' in product and not isinstance(product['images'], list):
-                        product['images'] = []
-                    # Make sure we never return None values for images
-                    if 'images' in product:
-                        product['images'] = [img for img in product['images'] if img]
-            return data
+            return self._store.generation()
         except Exception as e:
-            print(f"Error getting {self.collection_name}: {e}")
-            return []
+            print(f"Error reading generation for {self.collection_name}: {e}")
+            return ''
     
-    def save_all(self, data: List[Dict[str, Any]]) -> bool:
-        """Save all documents to the collection"""
-        try:
-            data_json = json.dumps(data)
-            db.storage.text.put(self.collection_name, data_json)
+    def _load(self) -> List[Dict[str, Any]]:
+        """Return the cached documents, reloading them if the stored generation changed"""
+        with self._lock:
+            if self._cache is not None and self._uow_depth:
+                # A unit of work owns the cache until it commits
+                self.cache_hits += 1
+                return self._cache
+            generation = self._read_generation()
+            if self._cache is not None and generation == self._generation:
+                self.cache_hits += 1
+                return self._cache
+            
+            self.cache_misses += 1
+            try:
+                data = self._store.load()
+            except Exception as e:
+                print(f"Error getting {self.collection_name}: {e}")
+                self._cache = None
+                return []
+            
+            if self._pending_increments:
+                # Increments not yet persisted stay visible over the reloaded documents
+                data = replay_log_records(data, self._increment_records(self._pending_increments))
+            self._cache = data
+            self._generation = generation
+            self._reset_indexes()
+            return data
+    
+    def _id_positions(self, data: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Get the id -> position index for the loaded documents, building it if needed"""
+        if self._id_index is None:
+            index = {}
+            for i, item in enumerate(data):
+                item_id = item.get('id')
+                if item_id is not None:
+                    # Keep the first occurrence, matching the old linear scan
+                    index.setdefault(item_id, i)
+            self._id_index = index
+        return self._id_index
+    
+    def _index_keys(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Compute the secondary index keys of a document, skipping unusable ones"""
+        keys = {}
+        for name, key_fn in self.indexes.items():
+            try:
+                key = key_fn(item)
+                hash(key)
+            except Exception:
+                continue
+            if key is not None:
+                keys[name] = key
+        return keys
+    
+    def _field_positions(self, data: List[Dict[str, Any]]) -> Dict[str, Dict[Any, List[int]]]:
+        """Get the secondary indexes for the loaded documents, building them if needed"""
+        if self._field_indexes is None:
+            field_indexes = {name: {} for name in self.indexes}
+            for i, item in enumerate(data):
+                for name, key in self._index_keys(item).items():
+                    field_indexes[name].setdefault(key, []).append(i)
+            self._field_indexes = field_indexes
+        return self._field_indexes
+    
+    def _sorted_entries(self, data: List[Dict[str, Any]], sort_name: str) -> List[Tuple[Any, str]]:
+        """Get the (sort key, id) entries of a sort order in ascending order, building them if needed
+
+        Only documents reachable through the id index take part, so every entry
+        resolves to exactly one document.
+        """
+        entries = self._sorted_indexes.get(sort_name)
+        if entries is None:
+            key_fn = self.sort_keys[sort_name]
+            entries = sorted((key_fn(data[position]), id) for id, position in self._id_positions(data).items()
+                             if isinstance(id, str))
+            self._sorted_indexes[sort_name] = entries
+        return entries
+    
+    def _text_entries(self, data: List[Dict[str, Any]]) -> TextIndex:
+        """Get the full-text index for the loaded documents, building it if needed"""
+        if self._text_index is None:
+            text_index = TextIndex(self.text_fields)
+            for id, position in self._id_positions(data).items():
+                if isinstance(id, str):
+                    text_index.add(id, data[position])
+            self._text_index = text_index
+        return self._text_index
+    
+    def _trigram_entries(self, data: List[Dict[str, Any]]) -> TrigramIndex:
+        """Get the trigram index for the loaded documents, building it if needed"""
+        if self._trigram_index is None:
+            trigram_index = TrigramIndex(self.fuzzy_fields, tokenizer=self.fuzzy_tokenizer)
+            for id, position in self._id_positions(data).items():
+                if isinstance(id, str):
+                    trigram_index.add(id, data[position])
+            self._trigram_index = trigram_index
+        return self._trigram_index
+    
+    def _columnar_entries(self, data: List[Dict[str, Any]]) -> ColumnarIndex:
+        """Get the columnar snapshot of the loaded documents, building it if needed"""
+        if self._columnar_index is None:
+            columnar_index = ColumnarIndex(self.columns)
+            for id, position in self._id_positions(data).items():
+                if isinstance(id, str):
+                    columnar_index.add(id, data[position])
+            self._columnar_index = columnar_index
+        return self._columnar_index
+    
+    def _multi_keys(self, doc: Dict[str, Any]) -> Dict[str, Set[Any]]:
+        """Compute the keys of a document in every multi-key index, skipping unusable ones"""
+        keys = {}
+        for name, keys_fn in self.multi_indexes.items():
+            keys[name] = set()
+            try:
+                doc_keys = list(keys_fn(doc))
+            except Exception:
+                continue
+            for key in doc_keys:
+                try:
+                    hash(key)
+                except TypeError:
+                    continue
+                if key is not None:
+                    keys[name].add(key)
+        return keys
+    
+    def _multi_entries(self, data: List[Dict[str, Any]]) -> Dict[str, Dict[Any, Set[str]]]:
+        """Get the multi-key indexes (key -> document ids) of the loaded documents, building them if needed"""
+        if self._multi_index is None:
+            multi_index = {name: {} for name in self.multi_indexes}
+            for id, position in self._id_positions(data).items():
+                if isinstance(id, str):
+                    for name, keys in self._multi_keys(data[position]).items():
+                        for key in keys:
+                            multi_index[name].setdefault(key, set()).add(id)
+            self._multi_index = multi_index
+        return self._multi_index
+    
+    def _facet_entries(self, data: List[Dict[str, Any]]) -> FacetIndex:
+        """Get the facet counts of the loaded documents, building them if needed"""
+        if self._facet_index is None:
+            facet_index = FacetIndex(self.facets)
+            for id, position in self._id_positions(data).items():
+                if isinstance(id, str):
+                    facet_index.add(id, data[position])
+            self._facet_index = facet_index
+        return self._facet_index
+    
+    def _keyed_insert(self, doc: Dict[str, Any]) -> None:
+        """Add a document to every built index keyed by id (sorted, multi-key, text, trigram, columnar and facet indexes)"""
+        for name, entries in self._sorted_indexes.items():
+            bisect.insort(entries, (self.sort_keys[name](doc), doc['id']))
+        if self._text_index is not None:
+            self._text_index.add(doc['id'], doc)
+        if self._trigram_index is not None:
+            self._trigram_index.add(doc['id'], doc)
+        if self._columnar_index is not None:
+            self._columnar_index.add(doc['id'], doc)
+        if self._facet_index is not None:
+            self._facet_index.add(doc['id'], doc)
+        if self._multi_index is not None:
+            for name, keys in self._multi_keys(doc).items():
+                for key in keys:
+                    self._multi_index[name].setdefault(key, set()).add(doc['id'])
+    
+    def _keyed_remove(self, doc: Dict[str, Any]) -> None:
+        """Remove a document from every built index keyed by id (sorted, multi-key, text, trigram, columnar and facet indexes)"""
+        for name, entries in self._sorted_indexes.items():
+            entry = (self.sort_keys[name](doc), doc['id'])
+            i = bisect.bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+        if self._text_index is not None:
+            self._text_index.remove(doc['id'])
+        if self._trigram_index is not None:
+            self._trigram_index.remove(doc['id'])
+        if self._columnar_index is not None:
+            self._columnar_index.remove(doc['id'])
+        if self._facet_index is not None:
+            self._facet_index.remove(doc['id'])
+        if self._multi_index is not None:
+            for name, keys in self._multi_keys(doc).items():
+                for key in keys:
+                    ids = self._multi_index[name].get(key)
+                    if ids is not None:
+                        ids.discard(doc['id'])
+                        if not ids:
+                            del self._multi_index[name][key]
+    
+    def _reset_indexes(self) -> None:
+        """Drop the id, secondary and id-keyed indexes so they are rebuilt on next use"""
+        self._id_index = None
+        self._field_indexes = None
+        self._sorted_indexes = {}
+        self._text_index = None
+        self._trigram_index = None
+        self._columnar_index = None
+        self._facet_index = None
+        self._multi_index = None
+    
+    def _persist(self, data: List[Dict[str, Any]], records: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """Write documents through to storage and refresh the cache
+
+        records describes the change from the cached state to data, letting the store
+        persist only the change, and makes the write conditional on the cached
+        generation. On a conflict the collection is reloaded and the records are
+        re-applied; the cache then holds the rebased list (not data) and the indexes are
+        reset, so callers only maintain indexes incrementally when self._cache is data.
+        Without records the full collection is written unconditionally (and in log mode
+        any log is folded into the snapshot). Inside a unit of work the write is
+        deferred to commit.
+        """
+        if self._uow_depth:
+            self._cache = data
+            if records is None or self._uow_records is None:
+                self._uow_records = None
+            else:
+                self._uow_records.extend(records)
             return True
+        if records is not None and self._cache is None:
+            # The collection could not be loaded; never write a delta against unknown state
+            print(f"Error saving {self.collection_name}: collection is not loaded")
+            return False
+        
+        # Pending increments are already applied to the cache, so they go out with this write.
+        # A full write replaces the documents, increments included.
+        pending, self._pending_increments = self._pending_increments, {}
+        if records is not None and pending:
+            records = self._increment_records(pending) + records
+        expected_generation = self._generation if records is not None else None
+        try:
+            for attempt in range(MAX_WRITE_RETRIES + 1):
+                try:
+                    generation = self._store.write(data, records, expected_generation)
+                    break
+                except GenerationConflict:
+                    if attempt == MAX_WRITE_RETRIES:
+                        raise
+                    print(f"Write conflict on {self.collection_name}, re-applying {len(records)} change(s)")
+                    expected_generation = self._store.generation()
+                    data = replay_log_records(self._store.load(), records)
+                    self._reset_indexes()
+            self._cache = data
+            self._generation = generation
         except Exception as e:
             print(f"Error saving {self.collection_name}: {e}")
+            self._restore_increments(pending)
+            self.invalidate_cache()
             return False
+        
+        if self._store.pending_records() >= self.compaction_threshold:
+            self._schedule_compaction()
+        return True
+    
+    @contextmanager
+    def unit_of_work(self):
+        """Collect mutations made inside the block and commit them in a single write
+
+        Holds the collection lock for the duration. If the block raises, the staged
+        mutations are discarded; if the commit fails, CollectionWriteError is raised.
+        """
+        with self._lock:
+            outermost = self._uow_depth == 0
+            if outermost:
+                self._load()
+                self._uow_records = []
+            self._uow_depth += 1
+            try:
+                yield self
+            except BaseException:
+                if outermost:
+                    self._uow_depth = 0
+                    self._uow_records = []
+                    self.invalidate_cache()
+                raise
+            finally:
+                if self._uow_depth:
+                    self._uow_depth -= 1
+            
+            if outermost:
+                records, self._uow_records = self._uow_records, []
+                if records == [] or self._cache is None:
+                    return
+                if not self._persist(self._cache, records):
+                    raise CollectionWriteError(f"Failed to commit changes to {self.collection_name}")
+    
+    def _schedule_compaction(self) -> None:
+        """Start a background compaction unless one is already running"""
+        if self._compacting:
+            return
+        self._compacting = True
+        threading.Thread(target=self.compact, name=f"compact-{self.collection_name}", daemon=True).start()
+    
+    def compact(self) -> bool:
+        """Fold the log into the snapshot and clear it (log mode only)"""
+        try:
+            with self._lock:
+                if self._pending_increments and not self.flush_increments():
+                    return False
+                data = self._load()
+                records = self._store.pending_records()
+                if not records:
+                    return True
+                # The documents are unchanged, so the cache and indexes stay valid. The write
+                # is conditional so records appended by another worker are never dropped.
+                try:
+                    self._generation = self._store.write(data, None, self._generation)
+                except GenerationConflict:
+                    print(f"Skipped compaction of {self.collection_name}: it changed concurrently")
+                    return False
+                except Exception as e:
+                    print(f"Error compacting {self.collection_name}: {e}")
+                    self.invalidate_cache()
+                    return False
+                print(f"Compacted {records} log records into {self.collection_name} snapshot")
+                return True
+        finally:
+            self._compacting = False
+    
+    def invalidate_cache(self) -> None:
+        """Drop the cached documents so the next read goes to storage"""
+        with self._lock:
+            self._cache = None
+            self._generation = None
+            self._store.reset()
+            self._reset_indexes()
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters for this collection"""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "collection": self.collection_name,
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hitRate": round(self.cache_hits / lookups, 4) if lookups else None,
+            "cached": self._cache is not None,
+            "size": len(self._cache) if self._cache is not None else None,
+            "pendingIncrements": len(self._pending_increments),
+            "lastWrite": self._store.stats()
+        }
+    
+    def get_all(self) -> List[Dict[str, Any]]:
+        """Get all documents in the collection
+
+        Returns a new list; the documents themselves are shared with the cache and
+        must not be modified in place (use update instead).
+        """
+        return list(self._load())
+    
+    def save_all(self, data: List[Dict[str, Any]]) -> bool:
+        """Save all documents to the collection"""
+        with self._lock:
+            saved = self._persist(list(data))
+            self._reset_indexes()
+            return saved
     
     def get_by_id(self, id: str) -> Optional[Dict[str, Any]]:
         """Get a document by ID"""
-        data = self.get_all()
-        for item in data:
-            if item.get('id') == id:
-                return item
-        return None
-    
+        with self._lock:
+            data = self._load()
+            position = self._id_positions(data).get(id)
+            return data[position] if position is not None else None
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several documents by ID with a single load
+
+        Returns a dict of the documents found keyed by ID; unknown IDs are left out.
+        """
+        with self._lock:
+            data = self._load()
+            index = self._id_positions(data)
+            found = {}
+            for id in ids:
+                position = index.get(id)
+                if position is not None:
+                    found[id] = data[position]
+            return found
+
     def add(self, item: Dict[str, Any]) -> bool:
         """Add a new document to the collection"""
-        data = self.get_all()
-        data.append(item)
-        return self.save_all(data)
+        return self.bulk_add([item])
+    
+    def bulk_add(self, items: List[Dict[str, Any]]) -> bool:
+        """Add several documents to the collection with a single write"""
+        if not items:
+            return True
+        with self._lock:
+            data = self._load()
+            index = self._id_positions(data)
+            records = [{"op": "add", "doc": item} for item in items]
+            new_data = data + list(items)
+            if not self._persist(new_data, records):
+                return False
+            if self._cache is not new_data:
+                return True
+            for position, item in enumerate(items, start=len(data)):
+                if item.get('id') is not None:
+                    index.setdefault(item['id'], position)
+                    if isinstance(item['id'], str) and index[item['id']] == position:
+                        self._keyed_insert(item)
+                if self._field_indexes is not None:
+                    for name, key in self._index_keys(item).items():
+                        self._field_indexes[name].setdefault(key, []).append(position)
+            self._id_index = index
+            return True
     
     def update(self, id: str, updates: Dict[str, Any]) -> bool:
         """Update a document by ID"""
-        data = self.get_all()
-        for i, item in enumerate(data):
-            if item.get('id') == id:
-                data[i] = {**item, **updates}
-                return self.save_all(data)
-        return False
+        return self.bulk_update({id: updates}) == 1
+    
+    def bulk_update(self, updates: Dict[str, Dict[str, Any]]) -> int:
+        """Update several documents by ID with a single write
+
+        Returns the number of documents updated (0 if none matched or the write failed).
+        """
+        with self._lock:
+            data = self._load()
+            index = self._id_positions(data)
+            new_data = list(data)
+            records = []
+            positions = []
+            for id, changes in updates.items():
+                position = index.get(id)
+                if position is None:
+                    continue
+                new_data[position] = {**new_data[position], **changes}
+                records.append({"op": "update", "id": id, "changes": changes})
+                positions.append(position)
+            if not records:
+                return 0
+            if not self._persist(new_data, records):
+                return 0
+            if self._cache is new_data:
+                self._reindex_updated(index, data, new_data, positions)
+            return len(records)
+    
+    def increment(self, id: str, field: str, delta: Union[int, float] = 1) -> bool:
+        """Add delta to a counter field of a document (a missing or null field counts as 0)
+
+        The new value is visible to reads at once; the write is coalesced with the
+        other increments of the flush window. Returns False if no document has the ID.
+        """
+        return self.bulk_increment({id: {field: delta}}) == 1
+    
+    def bulk_increment(self, deltas: Dict[str, Dict[str, Union[int, float]]]) -> int:
+        """Add deltas to counter fields of several documents (id -> field -> delta)
+
+        Returns the number of documents changed (0 if none matched or the write failed).
+        """
+        with self._lock:
+            data = self._load()
+            index = self._id_positions(data)
+            new_data = list(data)
+            applied = {}
+            positions = []
+            for id, fields in deltas.items():
+                position = index.get(id)
+                if position is None or not fields:
+                    continue
+                new_data[position] = apply_increments(new_data[position], fields)
+                applied[id] = fields
+                positions.append(position)
+            if not applied:
+                return 0
+            if self._uow_depth:
+                # Inside a unit of work the increments commit with the rest of it
+                if not self._persist(new_data, self._increment_records(applied)):
+                    return 0
+            else:
+                self._cache = new_data
+                self._restore_increments(applied)
+                self._schedule_flush()
+            if self._cache is new_data:
+                self._reindex_updated(index, data, new_data, positions)
+            return len(applied)
+    
+    @staticmethod
+    def _increment_records(deltas: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Build the increment records of id -> field -> delta"""
+        return [{"op": "increment", "id": id, "deltas": fields} for id, fields in deltas.items()]
+    
+    def _restore_increments(self, deltas: Dict[str, Dict[str, Any]]) -> None:
+        """Add increments to the pending ones, summing deltas of the same field"""
+        for id, fields in deltas.items():
+            pending = self._pending_increments.setdefault(id, {})
+            for field, delta in fields.items():
+                pending[field] = pending.get(field, 0) + delta
+    
+    def _schedule_flush(self) -> None:
+        """Persist the pending increments once the flush window ends, unless a flush is already scheduled"""
+        if self._flush_timer is not None:
+            return
+        def run():
+            with self._lock:
+                self._flush_timer = None
+                if not self.flush_increments():
+                    self._schedule_flush()
+        self._flush_timer = threading.Timer(COUNTER_FLUSH_INTERVAL, run)
+        self._flush_timer.name = f"flush-{self.collection_name}"
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+    
+    def flush_increments(self) -> bool:
+        """Persist the pending increments now, in one write"""
+        with self._lock:
+            if not self._pending_increments or self._uow_depth:
+                return True
+            data = self._load()
+            if self._cache is None:
+                return False
+            return self._persist(data, [])
+    
+    def _reindex_updated(self, index: Dict[str, int], data: List[Dict[str, Any]],
+                         new_data: List[Dict[str, Any]], positions: List[int]) -> None:
+        """Bring the indexes of data up to date with new_data, which changed the documents at positions"""
+        if any(new_data[position].get('id') != data[position].get('id') for position in positions):
+            # An update changed a document's id, so positions must be re-derived
+            self._reset_indexes()
+            return
+        self._id_index = index
+        if self._field_indexes is not None:
+            for position in positions:
+                self._reindex_position(position, data[position], new_data[position])
+        for position in positions:
+            if isinstance(data[position]['id'], str):
+                self._keyed_remove(data[position])
+                self._keyed_insert(new_data[position])
+    
+    def _reindex_position(self, position: int, old: Dict[str, Any], new: Dict[str, Any]) -> None:
+        """Move a document between secondary index buckets after an update"""
+        old_keys = self._index_keys(old)
+        new_keys = self._index_keys(new)
+        for name, field_index in self._field_indexes.items():
+            if old_keys.get(name) == new_keys.get(name):
+                continue
+            if name in old_keys:
+                field_index[old_keys[name]].remove(position)
+                if not field_index[old_keys[name]]:
+                    del field_index[old_keys[name]]
+            if name in new_keys:
+                bisect.insort(field_index.setdefault(new_keys[name], []), position)
     
     def delete(self, id: str) -> bool:
         """Delete a document by ID"""
-        data = self.get_all()
-        filtered_data = [item for item in data if item.get('id') != id]
-        if len(filtered_data) < len(data):
-            return self.save_all(filtered_data)
-        return False
+        with self._lock:
+            data = self._load()
+            position = self._id_positions(data).get(id)
+            if position is None:
+                return False
+            filtered_data = [item for item in data if item.get('id') != id]
+            saved = self._persist(filtered_data, [{"op": "delete", "id": id}])
+            # Indexes keyed by id hold no positions and survive; positions after the removed documents have shifted
+            keyed_indexes = ({}, None, None, None, None, None)
+            if saved and self._cache is filtered_data and isinstance(id, str):
+                self._keyed_remove(data[position])
+                keyed_indexes = (self._sorted_indexes, self._text_index, self._trigram_index, self._columnar_index,
+                                 self._facet_index, self._multi_index)
+            self._reset_indexes()
+            (self._sorted_indexes, self._text_index, self._trigram_index, self._columnar_index,
+             self._facet_index, self._multi_index) = keyed_indexes
+            return saved
+    
+    def find(self, index_name: str, key: Any) -> List[Dict[str, Any]]:
+        """Get all documents whose secondary index key equals key (or, for a multi-key index, includes it), in storage order"""
+        with self._lock:
+            data = self._load()
+            if index_name in self.multi_indexes:
+                id_positions = self._id_positions(data)
+                ids = self._multi_entries(data)[index_name].get(key, ())
+                return [data[i] for i in sorted(id_positions[id] for id in ids)]
+            positions = self._field_positions(data)[index_name].get(key, [])
+            return [data[i] for i in positions]
+    
+    def find_any(self, index_name: str, keys: Iterable[Any]) -> List[Dict[str, Any]]:
+        """Get all documents whose secondary index key equals (or, for a multi-key index, includes) any of keys, once each in storage order"""
+        with self._lock:
+            data = self._load()
+            if index_name in self.multi_indexes:
+                id_positions = self._id_positions(data)
+                entries = self._multi_entries(data)[index_name]
+                ids = set()
+                for key in keys:
+                    ids.update(entries.get(key, ()))
+                return [data[i] for i in sorted(id_positions[id] for id in ids)]
+            buckets = self._field_positions(data)[index_name]
+            positions = set()
+            for key in keys:
+                positions.update(buckets.get(key, ()))
+            return [data[i] for i in sorted(positions)]
+    
+    def find_one(self, index_name: str, key: Any) -> Optional[Dict[str, Any]]:
+        """Get the first document whose secondary index key equals key"""
+        matching = self.find(index_name, key)
+        return matching[0] if matching else None
     
     def query(self, query_fn) -> List[Dict[str, Any]]:
         """Query documents using a filter function"""
-        data = self.get_all()
-        return [item for item in data if query_fn(item)]
+        return [item for item in self._load() if query_fn(item)]
+    
+    def select(self, where: Optional[Dict[str, Any]] = None,
+               filters: Optional[List[Callable[[Dict[str, Any]], bool]]] = None,
+               ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+               search: Optional[str] = None, fuzzy: bool = False,
+               sort_by: Optional[Union[str, Callable[[Dict[str, Any]], Any]]] = None,
+               descending: bool = False, offset: int = 0, limit: Optional[int] = None,
+               count: bool = True, cursor: Optional[str] = None) -> QueryResult:
+        """Run a planned query and return one page of matching documents
+
+        where maps secondary index names (or, failing that, document fields) to the
+        value they must equal; ranges maps sort order names to inclusive (low, high)
+        bounds, either of which may be None; search is a full-text query over
+        text_fields, or with fuzzy a typo-tolerant one over fuzzy_fields; filters
+        are extra predicates. sort_by is a sort order name or a key function; named
+        orders break ties by id. offset and limit select the page, and count=False
+        skips counting the total. A cursor ("" for the first page) switches to keyset
+        pagination on the named sort order and ignores offset; malformed cursors
+        raise ValueError.
+        """
+        checks = list(filters or [])
+        named_sort = isinstance(sort_by, str)
+        if cursor is not None and not named_sort:
+            raise ValueError("Cursor pagination needs a named sort order")
+        after = decode_cursor(cursor, sort_by) if cursor else None
+        
+        with self._lock:
+            data = self._load()
+            if self._columnar_plan(where, filters, ranges, search, sort_by, cursor):
+                ids, total = self._columnar_entries(data).select(
+                    where or {}, {name: bounds for name, bounds in (ranges or {}).items() if bounds != (None, None)},
+                    sort_by, descending, offset, limit, count)
+                id_positions = self._id_positions(data)
+                return QueryResult([data[id_positions[id]] for id in ids], total)
+            
+            sources = []  # (size, index name or sort order, kind, bounds in the sorted index or bucket)
+            if where:
+                field_indexes = self._field_positions(data)
+                for name, value in where.items():
+                    if name in self.indexes and value is not None:
+                        bucket = field_indexes[name].get(value, [])
+                        sources.append((len(bucket), name, 'index', value, bucket))
+                    else:
+                        checks.append(lambda doc, name=name, value=value: doc.get(name) == value)
+            for name, (low, high) in (ranges or {}).items():
+                if low is None and high is None:
+                    continue
+                lo, hi = self._range_bounds(self._sorted_entries(data, name), low, high)
+                sources.append((hi - lo, name, 'range', (low, high), (lo, hi)))
+            scores = None
+            if search is not None and fuzzy and self.fuzzy_fields:
+                scores = self._trigram_entries(data).search(search)
+                sources.append((len(scores), None, 'text', scores, None))
+            elif search is not None and not fuzzy and self.text_fields:
+                scores = self._text_entries(data).search(search)
+                sources.append((len(scores), None, 'text', scores, None))
+            sources.sort(key=lambda source: source[0])
+            
+            driver = sources[0] if sources else None
+            sort_range = next((source for source in sources
+                               if named_sort and source[2] == 'range' and source[1] == sort_by), None)
+            end = None if limit is None else offset + limit
+            # Walking the sorted index past non-matching entries to fill a page visits about
+            # end * len(data) / size entries, and counting visits all of them unless the driver
+            # is the only condition (its size is then the total); sorting the driver's
+            # candidates costs about size. Only walk when the driver is dense.
+            driver_total = driver[0] if driver is not None and len(sources) == 1 and not checks else None
+            dense = (driver is not None and end is not None and (not count or driver_total is not None)
+                     and end * len(data) < driver[0] * driver[0])
+            if named_sort and (driver is None or sort_range is driver or dense):
+                # Read the page off the sorted index, within the range bounds when sorting by a range
+                entries = self._sorted_entries(data, sort_by)
+                lo, hi = 0, len(entries)
+                if sort_range is not None:
+                    lo, hi = sort_range[4]
+                    sources = [source for source in sources if source is not sort_range]
+                checks += [self._source_check(source) for source in sources]
+                id_positions = self._id_positions(data)
+                result = self._walk_sorted(entries, lo, hi, lambda id: data[id_positions[id]], checks,
+                                           descending, offset, limit, count and not dense, after,
+                                           sort_by if cursor is not None else None)
+                return result._replace(total=driver_total) if count and dense else result
+            
+            # Scan the smallest candidate source (or everything) in storage order
+            checks += [self._source_check(source) for source in sources[1:]]
+            if driver is None:
+                candidates = iter(data)
+            elif driver[2] == 'index':
+                candidates = (data[i] for i in driver[4])
+            elif driver[2] == 'text':
+                id_positions = self._id_positions(data)
+                candidates = (data[i] for i in sorted(id_positions[id] for id in driver[3]))
+            else:
+                id_positions = self._id_positions(data)
+                lo, hi = driver[4]
+                entries = self._sorted_entries(data, driver[1])
+                candidates = (data[i] for i in sorted(id_positions[id] for _, id in entries[lo:hi]))
+            if len(checks) == 1:
+                matches = filter(checks[0], candidates)
+            elif checks:
+                matches = (doc for doc in candidates if all(check(doc) for check in checks))
+            else:
+                matches = candidates
+            
+            if sort_by is None and scores is not None:
+                # Rank by relevance, best first, ties by id
+                matching = list(matches)
+                rank = lambda doc: (-scores[doc['id']], doc['id'])
+                if end is not None and end < len(matching):
+                    ordered = heapq.nsmallest(end, matching, key=rank)
+                else:
+                    ordered = sorted(matching, key=rank)
+                return QueryResult(ordered[offset:end], len(matching) if count else None)
+            if sort_by is None:
+                if count:
+                    matching = list(matches)
+                    return QueryResult(matching[offset:end], len(matching))
+                return QueryResult(list(itertools.islice(matches, offset, end)), None)
+            
+            if named_sort:
+                # Order the candidates like the sorted index would: by (sort key, id)
+                sort_key = self.sort_keys[sort_by]
+                matching = [doc for doc in matches if isinstance(doc.get('id'), str)]
+                total = len(matching) if count else None
+                if after is None and end is not None and end + 1 < len(matching):
+                    # Only the top of the candidates can reach the page (one more tells a cursor page has more)
+                    select_top = heapq.nlargest if descending else heapq.nsmallest
+                    matching = select_top(end + 1, matching, key=lambda doc: (sort_key(doc), doc['id']))
+                by_id = {doc['id']: doc for doc in matching}
+                entries = sorted((sort_key(doc), id) for id, doc in by_id.items())
+                result = self._walk_sorted(entries, 0, len(entries), by_id.__getitem__, [],
+                                           descending, offset, limit, False, after,
+                                           sort_by if cursor is not None else None)
+                return result._replace(total=total)
+            
+            matching = list(matches)
+            if end is not None and end < len(matching):
+                select_top = heapq.nlargest if descending else heapq.nsmallest
+                ordered = select_top(end, matching, key=sort_by)
+            else:
+                ordered = sorted(matching, key=sort_by, reverse=descending)
+            return QueryResult(ordered[offset:end], len(matching) if count else None)
+    
+    def facet_counts(self, where: Optional[Dict[str, Any]] = None,
+                     ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+                     search: Optional[str] = None, fuzzy: bool = False) -> FacetCounts:
+        """Count the facet values of the documents, optionally only of those matching select() filters
+
+        Unscoped counts are read off the facet index; scoped ones tally the facet
+        values of the documents select() matches.
+        """
+        with self._lock:
+            data = self._load()
+            facet_index = self._facet_entries(data)
+            if not where and not any(bounds != (None, None) for bounds in (ranges or {}).values()) and search is None:
+                return FacetCounts({name: dict(counts) for name, counts in facet_index.counts.items()},
+                                   len(facet_index.doc_values))
+            matches = self.select(where=where, ranges=ranges, search=search, fuzzy=fuzzy, count=False).items
+            ids = [doc['id'] for doc in matches if isinstance(doc.get('id'), str)]
+            return FacetCounts(facet_index.tally(ids), len(ids))
+    
+    def _columnar_plan(self, where: Optional[Dict[str, Any]], filters: Optional[List[Callable]],
+                       ranges: Optional[Dict[str, Tuple[Any, Any]]], search: Optional[str],
+                       sort_by: Any, cursor: Optional[str]) -> bool:
+        """Check whether a query has filters for the columnar snapshot to answer entirely"""
+        if not self.columnar or filters or search is not None or cursor is not None:
+            return False
+        kinds = {name: kind for name, (kind, _) in self.columns.items()}
+        where = where or {}
+        ranges = {name: bounds for name, bounds in (ranges or {}).items() if bounds != (None, None)}
+        if not where and not ranges:
+            # Unfiltered pages are a slice of a sorted index
+            return False
+        if any(kinds.get(name) != CATEGORICAL_COLUMN or value is None for name, value in where.items()):
+            return False
+        if any(kinds.get(name) not in (NUMERIC_COLUMN, TEXT_COLUMN) for name in ranges):
+            return False
+        return sort_by is None or (isinstance(sort_by, str) and kinds.get(sort_by) in (NUMERIC_COLUMN, TEXT_COLUMN))
+    
+    @staticmethod
+    def _range_bounds(entries: List[Tuple[Any, str]], low: Any, high: Any) -> Tuple[int, int]:
+        """Find the slice of a sorted index whose keys lie within inclusive bounds"""
+        lo = 0 if low is None else bisect.bisect_left(entries, (low,))
+        hi = len(entries) if high is None else bisect.bisect_right(entries, (high, _HIGHEST))
+        return lo, max(lo, hi)
+    
+    def _source_check(self, source: Tuple) -> Callable[[Dict[str, Any]], bool]:
+        """Turn a candidate source that does not drive the scan into a per-document check"""
+        _, name, kind, condition, _ = source
+        if kind == 'index':
+            return lambda doc: self._key_equals(self.indexes[name], doc, condition)
+        if kind == 'text':
+            return lambda doc: doc.get('id') in condition
+        low, high = condition
+        key_fn = self.sort_keys[name]
+        def in_range(doc):
+            key = key_fn(doc)
+            return (low is None or key >= low) and (high is None or key <= high)
+        return in_range
+    
+    @staticmethod
+    def _walk_sorted(entries: List[Tuple[Any, str]], lo: int, hi: int, resolve: Callable[[str], Dict[str, Any]],
+                     checks: List[Callable[[Dict[str, Any]], bool]], descending: bool, offset: int,
+                     limit: Optional[int], count: bool, after: Optional[Tuple[Any, str]],
+                     cursor_sort: Optional[str]) -> QueryResult:
+        """Read one page from entries[lo:hi] in sort order, optionally starting after a cursor
+
+        cursor_sort is the sort order name when paging by cursor; the page then gets a next cursor.
+        Raises ValueError if the cursor's key does not compare with the sort keys.
+        """
+        total = None
+        if count:
+            total = hi - lo if not checks else sum(
+                1 for i in range(lo, hi) if all(check(resolve(entries[i][1])) for check in checks))
+        
+        if after is not None:
+            # Seek past the cursor; offset does not apply to keyset pages
+            offset = 0
+            try:
+                if descending:
+                    hi = max(lo, min(hi, bisect.bisect_left(entries, tuple(after), lo, hi)))
+                else:
+                    lo = min(hi, max(lo, bisect.bisect_right(entries, tuple(after), lo, hi)))
+            except TypeError:
+                raise ValueError("Invalid cursor")
+        elif cursor_sort is not None:
+            offset = 0
+        walk = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        
+        if not checks:
+            # Every entry matches: the page is a slice of the index
+            end = len(walk) if limit is None else min(len(walk), offset + limit)
+            selected = walk[offset:end]
+            has_more = end < len(walk)
+        else:
+            selected = []
+            has_more = False
+            skipped = 0
+            for i in walk:
+                if not all(check(resolve(entries[i][1])) for check in checks):
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                if limit is not None and len(selected) == limit:
+                    has_more = True
+                    break
+                selected.append(i)
+        
+        page = [resolve(entries[i][1]) for i in selected]
+        next_cursor = None
+        if cursor_sort is not None and has_more and selected:
+            next_cursor = encode_cursor(cursor_sort, *entries[selected[-1]])
+        return QueryResult(page, total, next_cursor)
+    
+    @staticmethod
+    def _key_equals(key_fn: Callable[[Dict[str, Any]], Any], doc: Dict[str, Any], value: Any) -> bool:
+        """Check a document's index key against a value, treating unusable keys as no match"""
+        try:
+            return key_fn(doc) == value
+        except Exception:
+            return False
     
     def get_by_field(self, field: str, value: Any) -> Optional[Dict[str, Any]]:
         """Get the first document matching a field value"""
@@ -101,65 +1447,511 @@ class Collection(Generic[T]):
 # Enhanced collections that follow better eCommerce structure
 class UserCollection(Collection):
     """Collection for user management with enhanced methods"""
+    indexes = {
+        'email': lambda user: normalize_email(user.get('email')),
+        'role': lambda user: user.get('role'),
+        'status': lambda user: user.get('status'),
+    }
+    sort_keys = {
+        'createdAt': lambda user: user.get('createdAt', ''),
+    }
     
     def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get a user by email (case insensitive)"""
-        matching = self.query(lambda user: user.get('email', '').lower() == email.lower())
-        return matching[0] if matching else None
+        return self.find_one('email', normalize_email(email))
 
 class AddressCollection(Collection):
     """Collection for address management"""
+    # Addresses are stored with userId/isDefault; user_id/is_default are legacy spellings
+    indexes = {
+        'user_id': lambda address: address.get('userId', address.get('user_id')),
+    }
     
     def get_by_user_id(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all addresses for a user"""
-        return self.query(lambda address: address.get('user_id') == user_id)
+        return self.find('user_id', user_id)
     
     def get_default_for_user(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get the default address for a user"""
-        addresses = self.query(lambda address: 
-                              address.get('user_id') == user_id and 
-                              address.get('is_default') == True)
+        addresses = [address for address in self.get_by_user_id(user_id)
+                     if address.get('isDefault', address.get('is_default')) == True]
         return addresses[0] if addresses else None
 
 class OrderCollection(Collection):
     """Collection for order management"""
+    # Orders are stored with userId; user_id is the legacy spelling
+    indexes = {
+        'user_id': lambda order: order.get('userId') or order.get('user_id'),
+        'email': order_email,
+        'status': lambda order: order.get('status'),
+    }
+    # Orders by the products they contain, for supplier dashboards
+    multi_indexes = {
+        'product_id': lambda order: [order_item_product_id(item) for item in order.get('items') or []],
+    }
+    # Customer lookup for admins: names, phones and emails. Phones are matched by their digits,
+    # so formatting does not matter, and emails whole.
+    fuzzy_fields = {
+        'name': lambda order: (order.get('shippingInfo') or {}).get('fullName'),
+        'phone': lambda order: (order.get('shippingInfo') or {}).get('phone'),
+        'email': lambda order: normalize_email((order.get('shippingInfo') or {}).get('email')),
+    }
+    fuzzy_tokenizer = staticmethod(contact_tokenize)
+    sort_keys = {
+        'createdAt': lambda order: order.get('createdAt', ''),
+    }
     
     def get_by_user_id(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all orders for a user"""
-        return self.query(lambda order: order.get('user_id') == user_id)
+        return self.find('user_id', user_id)
     
     def get_by_email(self, email: str) -> List[Dict[str, Any]]:
         """Get all orders for a user by email"""
-        return self.query(lambda order: 
-                         order.get('shippingInfo', {}).get('email', '').lower() == email.lower())
+        return self.find('email', normalize_email(email))
     
     def get_by_status(self, status: str) -> List[Dict[str, Any]]:
         """Get all orders with a specific status"""
-        return self.query(lambda order: order.get('status') == status)
+        return self.find('status', status)
+
+# Storage keys older versions of the app kept orders under, still searched by the order lookups
+LEGACY_ORDER_KEYS = ['orders_backup', 'all_orders', 'user_orders']
+
+# Seconds a legacy key's version is trusted before it is checked again (a full read for keys without meta)
+LEGACY_VERSION_TTL = 60.0
+
+def load_legacy_orders(store: CollectionStore) -> List[Dict[str, Any]]:
+    """Load the orders of a legacy order key"""
+    data = store.load()
+    if isinstance(data, dict):
+        # Some legacy keys wrap the list as {"orders": [...]}
+        data = data.get('orders', [])
+    return [order for order in data if isinstance(order, dict)] if isinstance(data, list) else []
+
+class OrderEmailLookup:
+    """Email -> orders lookup across the orders collection and the legacy order keys
+
+    Orders in the collection are found through its email index. A legacy key that
+    has been consolidated into the collection at its current version (see
+    CollectionStore.version) is skipped; any other gets an email -> positions map of
+    its own, rebuilt only when the key's version changes. Versions are checked at
+    most once per LEGACY_VERSION_TTL, since legacy keys without meta are hashed in
+    full. Lookups never consolidate; that is the /migration/consolidate-orders job.
+    Orders are de-duplicated by id, the collection's copy first.
+    """
+    def __init__(self, orders: OrderCollection, legacy_keys: List[str],
+                 consolidation: Optional["OrderConsolidationCollection"] = None):
+        self.orders = orders
+        self.legacy_keys = legacy_keys
+        self.consolidation = consolidation
+        self._lock = threading.RLock()
+        self._stores: Dict[str, CollectionStore] = {}
+        self._legacy: Dict[str, Tuple[str, List[Dict[str, Any]], Dict[str, List[int]]]] = {}
+        # Legacy key -> (monotonic time checked, version)
+        self._versions: Dict[str, Tuple[float, str]] = {}
+    
+    def _legacy_index(self, key: str) -> Tuple[List[Dict[str, Any]], Dict[str, List[int]]]:
+        """Get a legacy key's orders and email index, reloading them if the key changed
+
+        Returns no orders for a key already consolidated into the collection.
+        """
+        store = self._stores.get(key)
+        if store is None:
+            store = self._stores[key] = get_storage_backend().open(key)
+        checked = self._versions.get(key)
+        now = time.monotonic()
+        if checked is not None and now - checked[0] < LEGACY_VERSION_TTL:
+            generation = checked[1]
+        else:
+            generation = store.version()
+            self._versions[key] = (now, generation)
+        if self.consolidation is not None and self.consolidation.is_consolidated(key, generation):
+            self._legacy.pop(key, None)
+            return [], {}
+        cached = self._legacy.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1], cached[2]
+        
+        data = load_legacy_orders(store)
+        index: Dict[str, List[int]] = {}
+        for position, order in enumerate(data):
+            email = order_email(order)
+            if email:
+                index.setdefault(email, []).append(position)
+        self._legacy[key] = (generation, data, index)
+        print(f"Indexed {len(data)} legacy orders from {key}")
+        return data, index
+    
+    def find(self, email: str) -> List[Dict[str, Any]]:
+        """Get every order placed with an email (case insensitive), collection first"""
+        email = normalize_email(email)
+        if not email:
+            return []
+        matches = list(self.orders.find('email', email))
+        seen = {order.get('id') for order in matches if order.get('id')}
+        with self._lock:
+            for key in self.legacy_keys:
+                try:
+                    data, index = self._legacy_index(key)
+                except Exception as e:
+                    print(f"Error loading legacy orders from {key}: {e}")
+                    continue
+                for position in index.get(email, []):
+                    order = data[position]
+                    if order.get('id'):
+                        if order['id'] in seen:
+                            continue
+                        seen.add(order['id'])
+                    matches.append(order)
+        return matches
+
+class OrderStatsCollection(Collection):
+    """Order counters, kept in a single document alongside the orders collection
+
+    The document holds the number of orders per status, the revenue (totalAmount of
+    orders that are not cancelled) and, per creation day, the number of orders and
+    their revenue, so the order summary never reads the orders. Order writes apply
+    deltas with record_created/record_status_change. A delta racing with another
+    worker's can be lost, so once the counters are older than
+    ORDER_STATS_RECOUNT_INTERVAL they are recounted from the orders in the background.
+    """
+    SUMMARY_ID = "summary"
+    
+    def __init__(self, collection_name: str, orders: OrderCollection, **kwargs):
+        super().__init__(collection_name, **kwargs)
+        self.orders = orders
+        self._recounting = False
+    
+    @staticmethod
+    def _amount(order: Dict[str, Any]) -> float:
+        try:
+            return float(order.get('totalAmount') or 0)
+        except (TypeError, ValueError):
+            return 0.0
+    
+    @staticmethod
+    def _day(order: Dict[str, Any]) -> str:
+        return str(order.get('createdAt') or '')[:10]
+    
+    def recount(self) -> Dict[str, Any]:
+        """Count every order and replace the counters"""
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            days: Dict[str, Dict[str, Any]] = {}
+            revenue = 0.0
+            for order in self.orders.get_all():
+                status = order.get('status') or 'pending'
+                statuses[status] = statuses.get(status, 0) + 1
+                day = days.setdefault(self._day(order), {"orders": 0, "revenue": 0.0})
+                day["orders"] += 1
+                if status != 'cancelled':
+                    day["revenue"] = round(day["revenue"] + self._amount(order), 2)
+                    revenue += self._amount(order)
+            summary = {
+                "id": self.SUMMARY_ID,
+                "statuses": statuses,
+                "revenue": round(revenue, 2),
+                "days": days,
+                "recountedAt": get_timestamp(),
+            }
+            if not self.save_all([summary]):
+                print(f"Error saving recounted order counters to {self.collection_name}")
+            return summary
+    
+    def _schedule_recount(self) -> None:
+        """Start a background recount unless one is already running"""
+        if self._recounting:
+            return
+        self._recounting = True
+        def run():
+            try:
+                self.recount()
+            finally:
+                self._recounting = False
+        threading.Thread(target=run, name=f"recount-{self.collection_name}", daemon=True).start()
+    
+    def summary(self) -> Dict[str, Any]:
+        """Get the order counters, counting the orders if there are none yet"""
+        summary = self.get_by_id(self.SUMMARY_ID)
+        if summary is None:
+            return self.recount()
+        try:
+            stale = datetime.now() - datetime.fromisoformat(summary.get('recountedAt', '')) > ORDER_STATS_RECOUNT_INTERVAL
+        except ValueError:
+            stale = True
+        if stale:
+            self._schedule_recount()
+        return summary
+    
+    def _apply(self, change: Callable[[Dict[str, Any]], None]) -> None:
+        """Apply a delta to the counters; without counters yet they are counted from the orders instead"""
+        with self._lock:
+            summary = self.get_by_id(self.SUMMARY_ID)
+            if summary is None:
+                self.recount()
+                return
+            summary = json.loads(json.dumps(summary))
+            change(summary)
+            if not self.update(self.SUMMARY_ID, {key: summary[key] for key in ("statuses", "revenue", "days")}):
+                print(f"Error updating order counters in {self.collection_name}")
+    
+    def record_created(self, order: Dict[str, Any]) -> None:
+        """Count a newly stored order"""
+        amount = self._amount(order)
+        status = order.get('status') or 'pending'
+        def change(summary):
+            summary["statuses"][status] = summary["statuses"].get(status, 0) + 1
+            day = summary["days"].setdefault(self._day(order), {"orders": 0, "revenue": 0.0})
+            day["orders"] += 1
+            if status != 'cancelled':
+                day["revenue"] = round(day["revenue"] + amount, 2)
+                summary["revenue"] = round(summary["revenue"] + amount, 2)
+        self._apply(change)
+    
+    def record_status_change(self, order: Dict[str, Any], new_status: str) -> None:
+        """Move an order between status counters, given the order as it was before the change"""
+        old_status = order.get('status') or 'pending'
+        if old_status == new_status:
+            return
+        amount = self._amount(order)
+        def change(summary):
+            statuses = summary["statuses"]
+            statuses[old_status] = max(0, statuses.get(old_status, 0) - 1)
+            if not statuses[old_status]:
+                del statuses[old_status]
+            statuses[new_status] = statuses.get(new_status, 0) + 1
+            if 'cancelled' in (old_status, new_status):
+                # Cancelled orders bring in no revenue
+                delta = amount if old_status == 'cancelled' else -amount
+                day = summary["days"].setdefault(self._day(order), {"orders": 0, "revenue": 0.0})
+                day["revenue"] = round(day["revenue"] + delta, 2)
+                summary["revenue"] = round(summary["revenue"] + delta, 2)
+        self._apply(change)
+
+class OrderConsolidationCollection(Collection):
+    """Merges the legacy order keys into the orders collection, one watermark document per key
+
+    A key is re-processed only when its stored version (the generation, or a content
+    hash for keys written without one) differs from the one it was last
+    consolidated at. Orders are matched by id and the most recently updated copy
+    (updatedAt, else createdAt) wins, the collection's copy on ties. Legacy orders
+    without an id get one derived from their content, so repeated runs do not
+    duplicate them. Items that only carry productId get it as their id, and orders
+    that still do not validate as an Order are skipped and reported; a key with
+    skipped orders keeps no watermark, so the lookups keep reading it. Inline
+    payment proofs are offloaded on the way in. The legacy keys themselves are
+    left untouched.
+    """
+    def __init__(self, collection_name: str, orders: OrderCollection, legacy_keys: List[str],
+                 stats: Optional[OrderStatsCollection] = None, **kwargs):
+        super().__init__(collection_name, **kwargs)
+        self.orders = orders
+        self.legacy_keys = legacy_keys
+        self.stats = stats
+    
+    def is_consolidated(self, key: str, generation: str) -> bool:
+        """Check whether a legacy key was consolidated at the given version"""
+        watermark = self.get_by_id(key)
+        return watermark is not None and watermark.get('generation') == generation
+    
+    @staticmethod
+    def _updated(order: Dict[str, Any]) -> str:
+        return str(order.get('updatedAt') or order.get('createdAt') or '')
+    
+    @staticmethod
+    def _normalize(order: Dict[str, Any]) -> Dict[str, Any]:
+        """Give items that only carry productId (older orders) an id"""
+        items = order.get('items')
+        if not isinstance(items, list):
+            return order
+        return {**order, 'items': [
+            {**item, 'id': order_item_product_id(item)}
+            if isinstance(item, dict) and not item.get('id') and order_item_product_id(item) else item
+            for item in items
+        ]}
+    
+    def consolidate(self) -> Dict[str, Any]:
+        """Merge every changed legacy key into the orders collection and advance the watermarks"""
+        from pydantic import ValidationError
+        from app.apis.orders import Order, offload_payment_proof
+        
+        with self._lock:
+            merged: Dict[str, Dict[str, Any]] = {}  # order id -> winning legacy copy
+            watermarks = []
+            results = {}
+            for key in self.legacy_keys:
+                store = get_storage_backend().open(key)
+                # Read the version first: a write racing with the load is picked up next run
+                generation = store.version()
+                if self.is_consolidated(key, generation):
+                    results[key] = {"skipped": True}
+                    continue
+                legacy_orders = load_legacy_orders(store)
+                invalid = []
+                for order in legacy_orders:
+                    if not order.get('id'):
+                        digest = hashlib.sha1(json.dumps(order, sort_keys=True, default=str).encode()).hexdigest()
+                        order = {**order, 'id': f"ord-legacy-{digest[:16]}"}
+                    order = self._normalize(order)
+                    try:
+                        Order.parse_obj(order)
+                    except ValidationError as e:
+                        print(f"Skipping legacy order {order['id']} from {key}: {e}")
+                        invalid.append(order['id'])
+                        continue
+                    current = merged.get(order['id']) or self.orders.get_by_id(order['id'])
+                    if current is None or self._updated(order) > self._updated(current):
+                        merged[order['id']] = order
+                if not invalid:
+                    watermarks.append({"id": key, "generation": generation, "consolidatedAt": get_timestamp(),
+                                       "orders": len(legacy_orders)})
+                results[key] = {"orders": len(legacy_orders) - len(invalid), "invalid": invalid}
+            
+            for id, order in merged.items():
+                if not order.get('paymentProof'):
+                    continue
+                try:
+                    merged[id] = {**order, 'paymentProof': offload_payment_proof(id, order['paymentProof'])}
+                except Exception as e:
+                    print(f"Error offloading payment proof of legacy order {id}: {e}")
+            added = [order for id, order in merged.items() if self.orders.get_by_id(id) is None]
+            updates = {id: order for id, order in merged.items() if self.orders.get_by_id(id) is not None}
+            if added or updates:
+                with self.orders.unit_of_work():
+                    self.orders.bulk_add(added)
+                    self.orders.bulk_update(updates)
+                if self.stats is not None:
+                    self.stats.recount()
+            # Watermarks only advance once the merge is stored
+            for watermark in watermarks:
+                if not self.update(watermark['id'], watermark):
+                    self.add(watermark)
+            print(f"Consolidated legacy orders: {len(added)} added, {len(updates)} updated")
+            return {"added": len(added), "updated": len(updates), "sources": results}
+
+# Lower bounds of the product price facet buckets; the last bucket is open-ended
+PRICE_BUCKET_BOUNDS = [0, 100, 250, 500, 1000, 2500]
+
+def price_bucket(price: Any) -> Optional[float]:
+    """Get the lower bound of the price facet bucket a price falls in"""
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    if price != price or price < 0:
+        return None
+    return PRICE_BUCKET_BOUNDS[bisect.bisect_right(PRICE_BUCKET_BOUNDS, price) - 1]
 
 class ProductCollection(Collection):
     """Collection for product management"""
+    indexes = {
+        'category': lambda product: product.get('category'),
+        'supplier_id': lambda product: product.get('supplierId'),
+        'featured': lambda product: product.get('featured'),
+    }
+    # Name matches count most, then brand and category, then supplier and description
+    text_fields = {
+        'name': 3.0,
+        'brand': 2.0,
+        'category': 1.5,
+        'supplierName': 1.0,
+        'description': 1.0,
+    }
+    facets = {
+        'category': lambda product: product.get('category'),
+        'supplier_id': lambda product: product.get('supplierId'),
+        'price_bucket': lambda product: price_bucket(product.get('price', 0)),
+        'featured': lambda product: product.get('featured') is True,
+    }
+    # Columns of the NumPy snapshot used when constructed with columnar=True
+    columns = {
+        'price': (NUMERIC_COLUMN, lambda product: product.get('price', 0)),
+        'salePrice': (NUMERIC_COLUMN, lambda product: product.get('salePrice')),
+        'rating': (NUMERIC_COLUMN, lambda product: product.get('rating', 0)),
+        'stock': (NUMERIC_COLUMN, lambda product: product.get('stock')),
+        'soldCount': (NUMERIC_COLUMN, lambda product: product.get('soldCount', 0)),
+        'createdAt': (TEXT_COLUMN, lambda product: product.get('createdAt', '')),
+        'category': (CATEGORICAL_COLUMN, lambda product: product.get('category')),
+        'supplier_id': (CATEGORICAL_COLUMN, lambda product: product.get('supplierId')),
+        'featured': (CATEGORICAL_COLUMN, lambda product: product.get('featured')),
+    }
+    # Product names are transliterated inconsistently ("teff"/"tef"), so they are also matched fuzzily
+    fuzzy_fields = {
+        'name': lambda product: product.get('name'),
+    }
+    sort_keys = {
+        'price': lambda product: product.get('price', 0),
+        'name': lambda product: product.get('name', '').lower(),
+        'rating': lambda product: product.get('rating', 0),
+        'createdAt': lambda product: product.get('createdAt', ''),
+    }
     
     def get_by_category(self, category: str) -> List[Dict[str, Any]]:
         """Get all products in a category"""
-        return self.query(lambda product: product.get('category') == category)
+        return self.find('category', category)
     
     def search(self, query: str) -> List[Dict[str, Any]]:
-        """Search products by name or description"""
-        query = query.lower()
-        return self.query(lambda product: 
-                         query in product.get('name', '').lower() or 
-                         query in product.get('description', '').lower())
+        """Search products by name, description, brand, category and supplier, best matches first"""
+        return self.select(search=query).items
+    
+    def fuzzy_search(self, query: str) -> List[Dict[str, Any]]:
+        """Search product names tolerating typos and spelling variants, most similar first"""
+        return self.select(search=query, fuzzy=True).items
 
 # Initialize enhanced database collections
 users = UserCollection('users')
 addresses = AddressCollection('addresses')
-orders = OrderCollection('orders')
-products = ProductCollection('products')
+# Orders are written far more often than they are rewritten wholesale, so they use the append-only log.
+# The two largest collections are parsed with orjson and compressed, since their documents
+# repeat the same keys and URLs and every cache miss transfers the whole snapshot.
+orders = OrderCollection('orders', storage_mode=LOG_MODE, codec=ORJSON_CODEC, compression=ZSTD_COMPRESSION)
+order_stats = OrderStatsCollection('order_stats', orders)
+order_consolidation = OrderConsolidationCollection('order_consolidation', orders, LEGACY_ORDER_KEYS, order_stats)
+order_email_lookup = OrderEmailLookup(orders, LEGACY_ORDER_KEYS, order_consolidation)
+# Catalog listings filter and sort large numbers of products, so they also run off a NumPy snapshot.
+products = ProductCollection('products', codec=ORJSON_CODEC, compression=ZSTD_COMPRESSION, columnar=True)
 
 # Shopping cart collection - primarily for future use with saved carts
 carts = Collection('carts')
 
+# Read a stored collection by name
+def read_collection(collection_name: str) -> List[Dict[str, Any]]:
+    """Read all documents stored under a collection name
+
+    Registered collections are read through their Collection (cache, log replay);
+    any other key (e.g. legacy order backups) is loaded from the storage backend.
+    """
+    collection_name = sanitize_storage_key(collection_name)
+    collection = _collections.get(collection_name)
+    if collection is not None:
+        return collection.get_all()
+    return get_storage_backend().open(collection_name).load()
+
+# Replace a stored collection by name
+def write_collection(collection_name: str, data: List[Dict[str, Any]]) -> bool:
+    """Replace all documents stored under a collection name"""
+    collection_name = sanitize_storage_key(collection_name)
+    collection = _collections.get(collection_name)
+    if collection is not None:
+        return collection.save_all(data)
+    try:
+        get_storage_backend().open(collection_name).write(data)
+        return True
+    except Exception as e:
+        print(f"Error saving {collection_name}: {e}")
+        return False
+
+# Persist every collection's pending increments, so none are lost when the process exits
+@atexit.register
+def flush_pending_increments() -> None:
+    """Flush the pending increments of every collection"""
+    for collection in list(_collections.values()):
+        collection.flush_increments()
+
+@router.get("/database/cache-stats")
+def get_cache_stats() -> Dict[str, Any]:
+    """Get in-process cache hit/miss counters for every collection"""
+    return {"collections": [collection.cache_stats() for collection in _collections.values()]}
+
 # Helper function to generate a timestamp for sorting
 def get_timestamp() -> str:
     """Get current timestamp in ISO format"""
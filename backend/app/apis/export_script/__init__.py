@@ -1,6 +1,7 @@
 import json
 import databutton as db
 from fastapi import APIRouter
+from app.apis.database import read_collection
 
 router = APIRouter(include_in_schema=False)
 
@@ -25,8 +26,7 @@ def export_data_for_digitalocean():
     # Export each collection
     for collection in collections:
         try:
-            data_json = db.storage.text.get(collection, default="[]")
-            database[collection] = json.loads(data_json)
+            database[collection] = read_collection(collection)
             print(f"Exported {len(database[collection])} items from {collection}")
         except Exception as e:
             print(f"Error exporting {collection}: {e}")
@@ -6,6 +6,7 @@ from datetime import datetime
 from typing import List, Dict, Any, Optional
 from fastapi import APIRouter, BackgroundTasks
 from pydantic import BaseModel
+from app.apis.database import read_collection, write_collection
 
 # Initialize the router
 router = APIRouter(prefix="/migration", tags=["migration"], include_in_schema=False)
@@ -15,6 +16,9 @@ class MigrationResponse(BaseModel):
     message: str
     result: Optional[Dict[str, Any]] = None
 
+class ImportDataRequest(BaseModel):
+    collections: Dict[str, List[Dict[str, Any]]]
+
 @router.get("/export-data")
 def export_data() -> MigrationResponse:
     """
@@ -31,8 +35,7 @@ def export_data() -> MigrationResponse:
         # Export each collection
         for collection in collections:
             try:
-                data_json = db.storage.text.get(collection, default="[]")
-                database[collection] = json.loads(data_json)
+                database[collection] = read_collection(collection)
                 print(f"Exported {len(database[collection])} items from {collection}")
             except Exception as e:
                 print(f"Error exporting {collection}: {e}")
@@ -49,6 +52,183 @@ def export_data() -> MigrationResponse:
             message=f"Error exporting data: {str(e)}"
         )
 
+@router.post("/import-data")
+def import_data(request: ImportDataRequest) -> MigrationResponse:
+    """
+    Import collections (in the /migration/export-data format) into the active storage backend.
+    This can be used to seed a single-node SQLite deployment from a Databutton export.
+    """
+    imported = {}
+    failed = []
+    for collection, documents in request.collections.items():
+        if write_collection(collection, documents):
+            imported[collection] = len(documents)
+            print(f"Imported {len(documents)} items into {collection}")
+        else:
+            failed.append(collection)
+    
+    if failed:
+        return MigrationResponse(
+            success=False,
+            message=f"Failed to import collections: {', '.join(failed)}",
+            result={"imported": imported}
+        )
+    return MigrationResponse(
+        success=True,
+        message="Data successfully imported",
+        result={"imported": imported}
+    )
+
+@router.post("/offload-payment-proofs")
+def offload_payment_proofs() -> MigrationResponse:
+    """
+    Move inline base64 payment proofs out of stored orders into binary storage.
+    Each proof is stored under the order ID and the order keeps only its URL; the
+    legacy order keys read by the lookup endpoints are rewritten the same way.
+    Safe to run repeatedly: already offloaded orders are skipped.
+    """
+    from app.apis.database import orders as orders_db, load_legacy_orders, LEGACY_ORDER_KEYS
+    from app.apis.orders import offload_payment_proof
+    from app.apis.storage import get_storage_backend, is_data_url
+    
+    moved = {}
+    failed = []
+    
+    # Canonical orders collection, updated with a single write
+    updates = {}
+    for order in orders_db.get_all():
+        if order.get('id') and is_data_url(order.get('paymentProof')):
+            try:
+                updates[order['id']] = {'paymentProof': offload_payment_proof(order['id'], order['paymentProof'])}
+            except Exception as e:
+                print(f"Error offloading payment proof of order {order['id']}: {e}")
+                failed.append(order['id'])
+    if updates and orders_db.bulk_update(updates) != len(updates):
+        return MigrationResponse(
+            success=False,
+            message="Failed to update orders with payment proof references"
+        )
+    moved['orders'] = len(updates)
+    
+    # Legacy order keys still read by the lookup endpoints; wrapped {"orders": [...]} payloads are written back as lists
+    for key in LEGACY_ORDER_KEYS:
+        legacy_orders = load_legacy_orders(get_storage_backend().open(key))
+        changed = 0
+        for order in legacy_orders:
+            if order.get('id') and is_data_url(order.get('paymentProof')):
+                try:
+                    order['paymentProof'] = offload_payment_proof(order['id'], order['paymentProof'])
+                    changed += 1
+                except Exception as e:
+                    print(f"Error offloading payment proof of order {order['id']} in {key}: {e}")
+                    failed.append(order['id'])
+        if changed and not write_collection(key, legacy_orders):
+            failed.append(key)
+            continue
+        moved[key] = changed
+    
+    print(f"Offloaded payment proofs: {moved}")
+    return MigrationResponse(
+        success=not failed,
+        message="Payment proofs offloaded" if not failed else f"Failed to offload: {', '.join(failed)}",
+        result={"moved": moved}
+    )
+
+@router.post("/consolidate-orders")
+def consolidate_orders_migration() -> MigrationResponse:
+    """
+    Merge the legacy order keys (orders_backup, all_orders, user_orders) into the
+    orders collection, de-duplicated by order ID with the most recently updated copy
+    winning. Keys unchanged since their last consolidation are skipped, and the
+    order lookups stop reading a key once it is consolidated. Legacy orders that
+    do not validate as an Order are skipped and listed per key; their key stays
+    unconsolidated, so the lookups keep finding them.
+    """
+    from app.apis.database import order_consolidation
+    
+    try:
+        result = order_consolidation.consolidate()
+    except Exception as e:
+        return MigrationResponse(
+            success=False,
+            message=f"Error consolidating orders: {str(e)}"
+        )
+    invalid = [id for source in result["sources"].values() for id in source.get("invalid", [])]
+    return MigrationResponse(
+        success=True,
+        message="Legacy orders consolidated" if not invalid else f"Legacy orders consolidated, skipped invalid: {', '.join(invalid)}",
+        result=result
+    )
+
+@router.post("/normalize-product-images")
+def normalize_product_images_migration() -> MigrationResponse:
+    """
+    Repair the images of stored products once, so reads no longer have to.
+    Missing or non-list images become [] and empty entries are dropped, matching
+    what create_product/update_product store. Safe to run repeatedly.
+    """
+    from app.apis.database import products as products_db
+    from app.apis.products import normalize_product_images
+    
+    updates = {}
+    for product in products_db.get_all():
+        if not product.get('id') or 'images' not in product:
+            continue
+        images = normalize_product_images(product['images'])
+        if images != product['images']:
+            updates[product['id']] = {'images': images}
+    
+    if updates and products_db.bulk_update(updates) != len(updates):
+        return MigrationResponse(
+            success=False,
+            message="Failed to repair product images"
+        )
+    
+    print(f"Normalized images of {len(updates)} products")
+    return MigrationResponse(
+        success=True,
+        message="Product images normalized",
+        result={"products": len(updates)}
+    )
+
+@router.post("/offload-product-images")
+def offload_product_images_migration() -> MigrationResponse:
+    """
+    Move inline base64 product images into the binary asset store.
+    Each product keeps only URL references to its images, served by
+    /products/{id}/images/{n}. Safe to run repeatedly.
+    """
+    from app.apis.database import products as products_db
+    from app.apis.products import offload_product_images
+    
+    updates = {}
+    failed = []
+    for product in products_db.get_all():
+        images = product.get('images')
+        if not product.get('id') or not isinstance(images, list):
+            continue
+        try:
+            references = offload_product_images(product['id'], images)
+        except Exception as e:
+            print(f"Error offloading images of product {product['id']}: {e}")
+            failed.append(product['id'])
+            continue
+        if references != images:
+            updates[product['id']] = {'images': references}
+    
+    if updates and products_db.bulk_update(updates) != len(updates):
+        return MigrationResponse(
+            success=False,
+            message="Failed to update products with image references"
+        )
+    
+    print(f"Offloaded images of {len(updates)} products")
+    return MigrationResponse(
+        success=not failed,
+        message="Product images offloaded" if not failed else f"Failed to offload: {', '.join(failed)}",
+        result={"products": len(updates)}
+    )
+
 # Export specific collections
 @router.get("/export-collection/{collection_name}")
 def export_collection(collection_name: str) -> MigrationResponse:
@@ -57,8 +237,7 @@ def export_collection(collection_name: str) -> MigrationResponse:
     """
     try:
         collection_name = sanitize_storage_key(collection_name)
-        data_json = db.storage.text.get(collection_name, default="[]")
-        data = json.loads(data_json)
+        data = read_collection(collection_name)
         
         return MigrationResponse(
             success=True,
@@ -93,8 +272,7 @@ def export_data_to_file():
         # Export each collection
         for collection in collections:
             try:
-                data_json = db.storage.text.get(collection, default="[]")
-                database[collection] = json.loads(data_json)
+                database[collection] = read_collection(collection)
                 print(f"Exported {len(database[collection])} items from {collection}")
             except Exception as e:
                 print(f"Error exporting {collection}: {e}")
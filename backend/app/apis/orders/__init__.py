@@ -1,14 +1,50 @@
 from fastapi import APIRouter, HTTPException, Path, Query, Body, Depends
-from pydantic import BaseModel, Field, EmailStr
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, EmailStr, validator
 from typing import List, Optional, Dict, Any
 import databutton as db
-from datetime import datetime
-from app.apis.database import orders as orders_db, users as users_db, products as products_db, generate_id, get_timestamp
+from datetime import datetime, timedelta
+from app.apis.database import orders as orders_db, users as users_db, products as products_db, order_stats, order_item_product_id, generate_id, get_timestamp, normalize_email
+from app.apis.storage import get_storage_backend, parse_data_url, is_data_url, public_api_url, api_route_reference, sanitize_storage_key, RASTER_IMAGE_TYPES, UPLOAD_RESPONSE_HEADERS
 from app.apis.telegram import send_telegram_message, format_order_notification, notify_new_order
 
 # Initialize the router
 router = APIRouter()
 
+# Size of the chunks payment proofs are streamed in
+PAYMENT_PROOF_CHUNK_SIZE = 64 * 1024
+
+# Content types accepted as payment proofs (the checkout takes images and PDFs)
+PAYMENT_PROOF_TYPES = RASTER_IMAGE_TYPES | {"application/pdf"}
+
+# Storage key of a payment proof; proofs stored before they had their own ids are keyed by order id
+def payment_proof_key(proof_id: str) -> str:
+    """Get the binary storage key holding a payment proof"""
+    return f"payment-proof-{sanitize_storage_key(proof_id)}"
+
+# URL an order's paymentProof field points to
+def payment_proof_url(order_id: str, proof_id: str) -> str:
+    """Get the URL serving a payment proof; order ids are not unique, so the proof has its own id"""
+    return f"/routes/orders/{order_id}/payment-proof?proof={proof_id}"
+
+# Move an inline payment proof into binary storage
+def offload_payment_proof(order_id: str, payment_proof: Optional[str]) -> Optional[str]:
+    """Store a base64 data URL payment proof as a binary object and return its URL
+
+    Anything that is not a data URL (None, or an already offloaded reference) is
+    returned unchanged. Raises ValueError if the proof is not an image or PDF, and
+    other errors if it cannot be stored.
+    """
+    if not is_data_url(payment_proof):
+        return payment_proof
+    parsed = parse_data_url(payment_proof)
+    if not parsed or parsed[0] not in PAYMENT_PROOF_TYPES:
+        raise ValueError("Payment proof must be an image or a PDF")
+    content_type, content = parsed
+    proof_id = generate_id("proof")
+    get_storage_backend().put_blob(payment_proof_key(proof_id), content, content_type)
+    return payment_proof_url(order_id, proof_id)
+
 # Function to update sold count for products based on orders
 def update_product_sold_counts(order_id: str) -> None:
     """Update product sold counts when an order is delivered"""
@@ -23,38 +59,21 @@ def update_product_sold_counts(order_id: str) -> None:
         if order.get('status') not in ['delivered', 'completed']:
             return
             
-        # Get the items from the order
-        order_items = order.get('items', [])
-        
-        # Process each product in the order
-        for item in order_items:
-            product_id = item.get('id')
+        # Total the quantity ordered of each product
+        quantities = {}
+        for item in order.get('items', []):
+            product_id = order_item_product_id(item)
             quantity = item.get('quantity', 0)
-            
             if not product_id or quantity <= 0:
                 continue
-                
-            try:
-                # Get the product
-                product = products_db.get_by_id(product_id)
-                if not product:
-                    print(f"Product {product_id} not found for sold count update")
-                    continue
-                    
-                # Update the sold count
-                current_sold = product.get('soldCount', 0)
-                product['soldCount'] = current_sold + quantity
-                product['updatedAt'] = get_timestamp()
-                
-                # Save the updated product
-                products_db.update(product_id, {
-                    'soldCount': current_sold + quantity,
-                    'updatedAt': get_timestamp()
-                })
-                print(f"Updated sold count for product {product_id} to {product['soldCount']}")
-                
-            except Exception as e:
-                print(f"Error updating sold count for product {product_id}: {str(e)}")
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        if not quantities:
+            return
+            
+        # Add to the sold counters; the increments are coalesced into one write
+        updated = products_db.bulk_increment({product_id: {'soldCount': quantity}
+                                              for product_id, quantity in quantities.items()})
+        print(f"Updated sold counts of {updated} of {len(quantities)} product(s) for order {order_id}")
     
     except Exception as e:
         print(f"Error in update_product_sold_counts: {str(e)}")
@@ -63,24 +82,21 @@ def update_product_sold_counts(order_id: str) -> None:
 def notify_suppliers_about_order(order: Dict[str, Any]) -> None:
     """Notify suppliers when products in their inventory are ordered"""
     try:
-        from app.apis.database import products as products_db
-        
         # Get order items
         order_items = order.get('items', [])
         if not order_items:
             return
             
+        # Resolve every ordered product with a single read
+        products = products_db.get_many(order_item_product_id(item) for item in order_items)
+            
         # Group items by supplier
         supplier_items = {}
         
         # Process each item in the order
         for item in order_items:
-            product_id = item.get('id')
-            if not product_id:
-                continue
-                
-            # Get full product details to find supplier
-            product = products_db.get_by_id(product_id)
+            product_id = order_item_product_id(item)
+            product = products.get(product_id) if product_id else None
             if not product:
                 continue
                 
@@ -108,10 +124,13 @@ def notify_suppliers_about_order(order: Dict[str, Any]) -> None:
                 
                 supplier_items[supplier_id]['total'] += item_total
         
+        # Resolve every supplier with a single read
+        suppliers = users_db.get_many(supplier_items)
+        
         # Notify each supplier about their products being ordered
         for supplier_id, data in supplier_items.items():
             # Get supplier details
-            supplier = users_db.get_by_id(supplier_id)
+            supplier = suppliers.get(supplier_id)
             if not supplier:
                 continue
                 
@@ -145,6 +164,11 @@ class OrderItem(BaseModel):
     image: str
     quantity: int
     category: str
+    
+    # Product image references are served to clients as absolute URLs
+    @validator("image")
+    def public_image_url(cls, image: str) -> str:
+        return public_api_url(image)
 
 class ShippingInfo(BaseModel):
     fullName: str
@@ -186,7 +210,8 @@ class GetOrderResponse(BaseModel):
 
 class GetOrdersResponse(BaseModel):
     orders: List[Order]
-    total: int
+    total: Optional[int] = None  # not counted for cursor pages after the first
+    nextCursor: Optional[str] = None
 
 class OrderStatus(BaseModel):
     status: str
@@ -199,6 +224,11 @@ class UpdateOrderStatusResponse(BaseModel):
     order: Order
     message: str
 
+class DailyOrderSummary(BaseModel):
+    date: str
+    orders: int
+    revenue: float
+
 class OrderSummary(BaseModel):
     total: int
     pending: int
@@ -206,6 +236,8 @@ class OrderSummary(BaseModel):
     shipped: int
     delivered: int
     cancelled: int
+    revenue: float = 0  # totalAmount of the orders that are not cancelled
+    daily: List[DailyOrderSummary] = []  # most recent days first
 
 # Helper function to validate request with user verification
 def get_user_by_email_or_id(user_email: Optional[str] = None, user_id: Optional[str] = None):
@@ -224,24 +256,30 @@ def get_user_by_email_or_id(user_email: Optional[str] = None, user_id: Optional[
 
 # Define the summary endpoint first to avoid it being masked by dynamic routes
 @router.get("/orders/summary", response_model=OrderSummary)
-def get_order_summary() -> OrderSummary:
-    """Get a summary of orders by status"""
-    all_orders = orders_db.get_all()
-    
-    # Count by status
-    pending_count = len([o for o in all_orders if o.get("status") == "pending"])
-    processing_count = len([o for o in all_orders if o.get("status") == "processing"])
-    shipped_count = len([o for o in all_orders if o.get("status") == "shipped"])
-    delivered_count = len([o for o in all_orders if o.get("status") == "delivered"])
-    cancelled_count = len([o for o in all_orders if o.get("status") == "cancelled"])
+def get_order_summary(
+    days: int = Query(30, ge=0, le=366, description="Number of most recent days to include in the daily breakdown")
+) -> OrderSummary:
+    """Get a summary of orders by status, with revenue and daily counts"""
+    # Served from the maintained order counters, never from the orders themselves
+    summary = order_stats.summary()
+    statuses = summary["statuses"]
+    
+    first_day = (datetime.now() - timedelta(days=days - 1)).date().isoformat() if days else None
+    daily = [
+        DailyOrderSummary(date=day, orders=counts["orders"], revenue=counts["revenue"])
+        for day, counts in sorted(summary["days"].items(), reverse=True)
+        if first_day is not None and day >= first_day
+    ]
     
     return OrderSummary(
-        total=len(all_orders),
-        pending=pending_count,
-        processing=processing_count,
-        shipped=shipped_count,
-        delivered=delivered_count,
-        cancelled=cancelled_count
+        total=sum(statuses.values()),
+        pending=statuses.get("pending", 0),
+        processing=statuses.get("processing", 0),
+        shipped=statuses.get("shipped", 0),
+        delivered=statuses.get("delivered", 0),
+        cancelled=statuses.get("cancelled", 0),
+        revenue=summary["revenue"],
+        daily=daily
     )# Endpoints
 @router.post("/orders/create", response_model=CreateOrderResponse)
 def create_order(order: CreateOrderRequest) -> CreateOrderResponse:
@@ -258,15 +296,24 @@ def create_order(order: CreateOrderRequest) -> CreateOrderResponse:
     timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
     order_id = f"ord-{timestamp}"
     
+    # Keep the proof image out of the order document; the order only references it
+    try:
+        payment_proof = offload_payment_proof(order_id, order.paymentProof)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error storing payment proof for order {order_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save payment proof")
+    
     # Create order
     new_order = {
         "id": order_id,
         "userId": user_id,
-        "items": [item.dict() for item in order.items],
+        "items": [{**item.dict(), "image": api_route_reference(item.image)} for item in order.items],
         "totalAmount": order.totalAmount,
         "shippingInfo": order.shippingInfo.dict(),
         "paymentMethod": order.paymentMethod,
-        "paymentProof": order.paymentProof,
+        "paymentProof": payment_proof,
         "status": "pending",
         "createdAt": get_timestamp(),
         "updatedAt": get_timestamp(),
@@ -277,6 +324,9 @@ def create_order(order: CreateOrderRequest) -> CreateOrderResponse:
     if not orders_db.add(new_order):
         raise HTTPException(status_code=500, detail="Failed to save order")
     
+    # Keep the summary counters current
+    order_stats.record_created(new_order)
+    
     # Send Telegram notification to admin
     try:
         telegram_result = notify_new_order(new_order)
@@ -299,31 +349,33 @@ def create_order(order: CreateOrderRequest) -> CreateOrderResponse:
 @router.get("/orders/all", response_model=GetOrdersResponse)
 def get_all_orders(
     status: Optional[str] = None,
+    search: Optional[str] = Query(None, description="Customer name, phone or email to look up, tolerating typos"),
     page: int = Query(1, ge=1),
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor: empty for the first page, then the previous page's nextCursor; replaces page")
 ) -> GetOrdersResponse:
     """Get all orders with optional filtering and pagination"""
-    # Get all orders
-    all_orders = orders_db.get_all()
-    
-    # Filter by status if provided
-    if status:
-        all_orders = [order for order in all_orders if order.get("status") == status]
-    
-    # Sort by creation date (newest first)
-    all_orders.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
-    
-    # Calculate pagination
-    total = len(all_orders)
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    
-    # Get paginated orders
-    paginated_orders = all_orders[start_idx:end_idx]
+    # Newest first, or best customer matches first when searching without a cursor; the status
+    # filter is answered from the status index and the customer search from the trigram index
+    try:
+        result = orders_db.select(
+            where={"status": status} if status else None,
+            search=search or None,
+            fuzzy=True,
+            sort_by=None if search and cursor is None else "createdAt",
+            descending=True,
+            offset=(page - 1) * limit,
+            limit=limit,
+            count=not cursor,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return GetOrdersResponse(
-        orders=[Order.parse_obj(order) for order in paginated_orders],
-        total=total
+        orders=[Order.parse_obj(order) for order in result.items],
+        total=result.total,
+        nextCursor=result.next_cursor
     )
 
 @router.get("/orders/user", response_model=GetOrdersResponse)
@@ -332,38 +384,35 @@ def get_user_orders(
     user_id: Optional[str] = Query(None, description="ID of the user to get orders for"),
     status: Optional[str] = None,
     page: int = Query(1, ge=1),
-    limit: int = Query(10, ge=1, le=50)
+    limit: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor: empty for the first page, then the previous page's nextCursor; replaces page")
 ) -> GetOrdersResponse:
     """Get all orders for a specific user"""
     if not email and not user_id:
         raise HTTPException(status_code=400, detail="Either email or user_id must be provided")
     
-    # Get all orders
-    all_orders = []
-    
-    if email:
-        all_orders = orders_db.get_by_email(email.lower())
-    elif user_id:
-        all_orders = orders_db.get_by_user_id(user_id)
-    
-    # Filter by status if provided
+    # Look the user's orders up by email or user ID, newest first
+    where = {"email": normalize_email(email)} if email else {"user_id": user_id}
     if status:
-        all_orders = [order for order in all_orders if order.get("status") == status]
+        where["status"] = status
     
-    # Sort by creation date (newest first)
-    all_orders.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
-    
-    # Calculate pagination
-    total = len(all_orders)
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    
-    # Get paginated orders
-    paginated_orders = all_orders[start_idx:end_idx]
+    try:
+        result = orders_db.select(
+            where=where,
+            sort_by="createdAt",
+            descending=True,
+            offset=(page - 1) * limit,
+            limit=limit,
+            count=not cursor,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return GetOrdersResponse(
-        orders=[Order.parse_obj(order) for order in paginated_orders],
-        total=total
+        orders=[Order.parse_obj(order) for order in result.items],
+        total=result.total,
+        nextCursor=result.next_cursor
     )
 
 @router.get("/orders/{order_id}", response_model=GetOrderResponse)
@@ -376,6 +425,38 @@ def get_order(order_id: str = Path(..., description="The ID of the order to retr
     
     return GetOrderResponse(order=Order.parse_obj(order))
 
+@router.get("/orders/{order_id}/payment-proof")
+def get_payment_proof(
+    order_id: str = Path(..., description="The ID of the order whose payment proof to retrieve"),
+    proof: Optional[str] = Query(None, description="The ID of the proof, from the order's paymentProof URL")
+):
+    """Stream the payment proof image of an order"""
+    blob = get_storage_backend().get_blob(payment_proof_key(proof or order_id))
+    if blob is None and proof:
+        raise HTTPException(status_code=404, detail="Payment proof not found")
+    if blob is None:
+        # Orders created before proofs were offloaded may still carry them inline
+        order = orders_db.get_by_id(order_id)
+        parsed = parse_data_url(order.get('paymentProof')) if order and is_data_url(order.get('paymentProof')) else None
+        if not parsed:
+            raise HTTPException(status_code=404, detail="Payment proof not found")
+        content_type, content = parsed
+    else:
+        content, content_type = blob
+    # Never serve a type a browser would run as a page from the API origin
+    if content_type not in PAYMENT_PROOF_TYPES:
+        raise HTTPException(status_code=404, detail="Payment proof not found")
+    
+    def iter_chunks():
+        for start in range(0, len(content), PAYMENT_PROOF_CHUNK_SIZE):
+            yield content[start:start + PAYMENT_PROOF_CHUNK_SIZE]
+    
+    return StreamingResponse(
+        iter_chunks(),
+        media_type=content_type,
+        headers={"Content-Length": str(len(content)), "Cache-Control": "private, max-age=86400", **UPLOAD_RESPONSE_HEADERS}
+    )
+
 @router.put("/orders/{order_id}/status", response_model=UpdateOrderStatusResponse)
 def update_order_status(
     order_id: str, 
@@ -406,6 +487,9 @@ def update_order_status(
     if not orders_db.update(order_id, updates):
         raise HTTPException(status_code=500, detail="Failed to update order status")
     
+    # Move the order between the summary's status counters
+    order_stats.record_status_change(order, update_data.status)
+    
     # If status is delivered or completed, update product sold counts
     if update_data.status in ["delivered", "completed"]:
         update_product_sold_counts(order_id)
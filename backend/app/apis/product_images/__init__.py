@@ -0,0 +1,49 @@
+from fastapi import APIRouter, HTTPException, Path
+from fastapi.responses import Response, RedirectResponse
+import re
+from app.apis.database import products as products_db
+from app.apis.storage import get_storage_backend, parse_data_url, is_data_url, RASTER_IMAGE_TYPES, UPLOAD_RESPONSE_HEADERS
+from app.apis.products import product_image_key, product_image_digest
+
+# Initialize router; product images are public so <img> tags and caches can load them
+router = APIRouter()
+
+# Product images are content-addressed, so their URLs can be cached for a year
+PRODUCT_IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Only absolute http(s) URLs are redirected to; anything else would make this an open redirect
+EXTERNAL_URL_PATTERN = re.compile(r'https?://', re.IGNORECASE)
+
+@router.get("/products/{product_id}/images/{position}")
+def get_product_image(
+    product_id: str = Path(..., description="The ID of the product"),
+    position: int = Path(..., ge=0, description="Position of the image in the product's images")
+):
+    """Serve a product image with long-lived cache headers"""
+    product = products_db.get_by_id(product_id)
+    images = (product or {}).get("images") or []
+    if position >= len(images):
+        raise HTTPException(status_code=404, detail="Image not found")
+    image = images[position]
+    
+    digest = product_image_digest(product_id, image)
+    if digest:
+        blob = get_storage_backend().get_blob(product_image_key(product_id, digest))
+        if blob is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        content, content_type = blob
+    elif is_data_url(image) and parse_data_url(image):
+        # Products saved before images were offloaded
+        content_type, content = parse_data_url(image)
+    elif isinstance(image, str) and EXTERNAL_URL_PATTERN.match(image):
+        # External image URL
+        return RedirectResponse(image)
+    else:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Never serve a type a browser would run as a page from the API origin
+    if content_type not in RASTER_IMAGE_TYPES:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Only content-addressed references are safe to cache for long
+    headers = {"Cache-Control": PRODUCT_IMAGE_CACHE_CONTROL, "ETag": f'"{digest}"'} if digest else {"Cache-Control": "no-cache"}
+    return Response(content=content, media_type=content_type, headers={**headers, **UPLOAD_RESPONSE_HEADERS})
@@ -1,14 +1,95 @@
 from fastapi import APIRouter, HTTPException, Query, Path, UploadFile, File, Form
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, validator
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 import databutton as db
+import hashlib
 import re
-from app.apis.database import products as products_db, generate_id, get_timestamp
+from app.apis.database import products as products_db, generate_id, get_timestamp, PRICE_BUCKET_BOUNDS
+from app.apis.storage import get_storage_backend, parse_data_url, is_data_url, public_api_url, RASTER_IMAGE_TYPES
 
 # Initialize router
 router = APIRouter()
 
+# Image URLs other than data URLs and references: http(s) links or paths, no other schemes
+EXTERNAL_IMAGE_URL_PATTERN = re.compile(r'https?://\S+|[^:]*', re.IGNORECASE)
+
+# References to offloaded images, e.g. /routes/products/prod-1/images/0?v=3f2a...
+# Clients send them back as absolute URLs, which offloading turns into references again
+PRODUCT_IMAGE_URL_PATTERN = re.compile(r'(?:https?://[^?#\s]*)?/routes/products/([^/?]+)/images/\d+\?v=([0-9a-f]+)')
+
+# Storage key of a product image
+def product_image_key(product_id: str, digest: str) -> str:
+    """Get the binary storage key holding a product image"""
+    return f"product-image-{product_id}-{digest}"
+
+# URL a product's images entry points to
+def product_image_url(product_id: str, position: int, digest: str) -> str:
+    """Get the URL serving a product image; the digest busts caches when the image changes"""
+    return f"/routes/products/{product_id}/images/{position}?v={digest}"
+
+# Digest of an offloaded image reference, None for anything else
+def product_image_digest(product_id: str, image: Any) -> Optional[str]:
+    """Get the content digest from one of this product's image references"""
+    match = PRODUCT_IMAGE_URL_PATTERN.fullmatch(image) if isinstance(image, str) else None
+    if not match or match.group(1) != product_id:
+        return None
+    return match.group(2)
+
+# Clean up a product's images list before it is stored
+def normalize_product_images(images: Any) -> List[str]:
+    """Return images as a list without empty entries (None, "", undefined from the frontend)
+
+    Products are normalized when written, so readers can return stored documents as-is.
+    """
+    if not isinstance(images, list):
+        return []
+    return [image for image in images if image]
+
+# Move inline product images into binary storage
+def offload_product_images(product_id: str, images: List[str]) -> List[str]:
+    """Store base64 data URL images as binary assets and return the list of references
+
+    External http(s) URLs and paths are kept as they are, and existing references are
+    renumbered to their new position. Raises ValueError for anything that is not a
+    raster image (e.g. SVG or HTML data URLs, javascript: links), and other errors if
+    an image cannot be stored.
+    """
+    backend = get_storage_backend()
+    references = []
+    for image in images:
+        position = len(references)
+        digest = product_image_digest(product_id, image)
+        if digest:
+            references.append(product_image_url(product_id, position, digest))
+            continue
+        if not is_data_url(image):
+            if not EXTERNAL_IMAGE_URL_PATTERN.fullmatch(image):
+                raise ValueError("Product images must be http(s) URLs or uploaded images")
+            references.append(image)
+            continue
+        parsed = parse_data_url(image)
+        if not parsed or parsed[0] not in RASTER_IMAGE_TYPES:
+            raise ValueError("Product images must be PNG, JPEG, GIF, WebP, AVIF or BMP")
+        content_type, content = parsed
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        backend.put_blob(product_image_key(product_id, digest), content, content_type)
+        references.append(product_image_url(product_id, position, digest))
+    return references
+
+# Remove image assets a product no longer references
+def delete_product_images(product_id: str, old_images: List[str], new_images: Optional[List[str]] = None) -> None:
+    """Delete the stored assets of old_images that are not in new_images"""
+    kept = {product_image_digest(product_id, image) for image in new_images or []}
+    backend = get_storage_backend()
+    for image in old_images or []:
+        digest = product_image_digest(product_id, image)
+        if digest and digest not in kept:
+            try:
+                backend.delete_blob(product_image_key(product_id, digest))
+            except Exception as e:
+                print(f"Error deleting image {digest} of product {product_id}: {e}")
+
 # Models
 class ProductBase(BaseModel):
     name: str
@@ -40,6 +121,11 @@ class Product(ProductBase):
     rating: Optional[float] = None
     numReviews: int = 0
     soldCount: int = 0
+    
+    # Offloaded images are stored as /routes/... references; clients get absolute URLs
+    @validator("images")
+    def public_image_urls(cls, images: List[str]) -> List[str]:
+        return [public_api_url(image) for image in images]
 
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
@@ -63,7 +149,8 @@ class ProductUpdate(BaseModel):
 
 class ProductsResponse(BaseModel):
     products: List[Product]
-    total: int
+    total: Optional[int] = None  # not counted for cursor pages after the first
+    nextCursor: Optional[str] = None
 
 class ProductResponse(BaseModel):
     product: Product
@@ -71,6 +158,42 @@ class ProductResponse(BaseModel):
 class CategoryResponse(BaseModel):
     categories: List[str]
 
+class PriceBucket(BaseModel):
+    min: float
+    max: Optional[float] = None  # None for the open-ended top bucket
+    count: int
+
+class ProductFacetsResponse(BaseModel):
+    total: int
+    categories: Dict[str, int]
+    suppliers: Dict[str, int]
+    priceBuckets: List[PriceBucket]
+    featured: int
+
+# Build the select() equality filters and price range of a product listing
+def listing_filters(
+    category: Optional[str],
+    featured: Optional[bool],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    supplier_id: Optional[str]
+) -> Tuple[Dict[str, Any], Dict[str, Tuple[Optional[float], Optional[float]]]]:
+    """Map product listing query parameters to select() where and ranges"""
+    # Equality filters are answered from the collection's indexes
+    where = {}
+    if category:
+        where["category"] = category
+    if featured is not None:
+        where["featured"] = featured
+    if supplier_id is not None:
+        where["supplier_id"] = supplier_id
+    
+    # Price bounds are resolved by bisecting the price-sorted index
+    ranges = {}
+    if min_price is not None or max_price is not None:
+        ranges["price"] = (min_price, max_price)
+    return where, ranges
+
 # Endpoints
 @router.post("/products", response_model=ProductResponse)
 def create_product(product: ProductCreate) -> ProductResponse:
@@ -78,6 +201,15 @@ def create_product(product: ProductCreate) -> ProductResponse:
     # Generate product ID
     product_id = generate_id("prod")
     
+    # Keep image bytes out of the catalog; the product only references them
+    try:
+        images = offload_product_images(product_id, normalize_product_images(product.images))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error storing images for product {product_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save product images")
+    
     # Create product object with all fields
     new_product = {
         "id": product_id,
@@ -87,7 +219,7 @@ def create_product(product: ProductCreate) -> ProductResponse:
         "salePrice": product.salePrice,
         "category": product.category,
         "stock": product.stock,
-        "images": product.images,
+        "images": images,
         "featured": product.featured,
         "brand": product.brand,
         "material": product.material,
@@ -123,90 +255,104 @@ def get_products(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     sort_by: str = "createdAt",
-    sort_order: str = "desc"
+    sort_order: str = "desc",
+    fuzzy: bool = Query(False, description="Match product names tolerating typos and spelling variants"),
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor: empty for the first page, then the previous page's nextCursor; replaces page")
 ) -> ProductsResponse:
     """Get all products with filtering, pagination and sorting"""
-    # Get all products
-    all_products = products_db.get_all()
-    
-    # Apply filters
-    if category:
-        all_products = [p for p in all_products if p.get("category") == category]
-    
-    if search:
-        search_lower = search.lower()
-        all_products = [p for p in all_products 
-                      if search_lower in p.get("name", "").lower() 
-                      or search_lower in p.get("description", "").lower()]
+    where, ranges = listing_filters(category, featured, min_price, max_price, supplier_id)
     
-    if featured is not None:
-        all_products = [p for p in all_products if p.get("featured") == featured]
+    # Search goes through the full-text index; sort_by=relevance ranks its matches best first
+    if sort_by == "relevance" and search and cursor is None:
+        order_by = None
+    else:
+        order_by = sort_by if sort_by in ("price", "name", "rating") else "createdAt"
     
-    if min_price is not None:
-        all_products = [p for p in all_products if p.get("price", 0) >= min_price]
+    # Pages are read off the pre-sorted indexes, the matches are never sorted per request
+    def run(fuzzy_match: bool):
+        return products_db.select(
+            where=where,
+            ranges=ranges,
+            search=search or None,
+            fuzzy=fuzzy_match,
+            sort_by=order_by,
+            descending=sort_order.lower() == "desc",
+            offset=(page - 1) * limit,
+            limit=limit,
+            count=not cursor,
+            cursor=cursor
+        )
     
-    if max_price is not None:
-        all_products = [p for p in all_products if p.get("price", 0) <= max_price]
-    
-    # Filter by supplier if provided
-    if supplier_id is not None:
-        all_products = [p for p in all_products if p.get("supplierId") == supplier_id]
-    
-    # Sort products
-    if sort_by == "price":
-        all_products.sort(key=lambda x: x.get("price", 0), 
-                         reverse=sort_order.lower() == "desc")
-    elif sort_by == "name":
-        all_products.sort(key=lambda x: x.get("name", "").lower(), 
-                         reverse=sort_order.lower() == "desc")
-    elif sort_by == "rating":
-        all_products.sort(key=lambda x: x.get("rating", 0), 
-                         reverse=sort_order.lower() == "desc")
-    else:  # Default sort by createdAt
-        all_products.sort(key=lambda x: x.get("createdAt", ""), 
-                         reverse=sort_order.lower() == "desc")
-    
-    # Calculate pagination
-    total = len(all_products)
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    
-    # Get paginated products
-    paginated_products = all_products[start_idx:end_idx]
+    try:
+        result = run(fuzzy)
+        # A search without exact matches falls back to fuzzy name matching ("tef" finds "Teff Flour").
+        # Cursor pages stay on one matching mode so the pages of a listing are consistent.
+        if search and not fuzzy and cursor is None and result.total == 0:
+            result = run(True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return ProductsResponse(
-        products=[Product.parse_obj(product) for product in paginated_products],
-        total=total
+        products=[Product.parse_obj(product) for product in result.items],
+        total=result.total,
+        nextCursor=result.next_cursor
     )
 
 @router.get("/products/categories", response_model=CategoryResponse)
 def get_categories() -> CategoryResponse:
     """Get all product categories"""
-    all_products = products_db.get_all()
-    
-    # Extract all categories
-    categories = list(set(p.get("category") for p in all_products if p.get("category")))
-    categories.sort()  # Sort alphabetically
+    # The category facet holds every category in use
+    category_counts = products_db.facet_counts().counts["category"]
+    categories = sorted(category for category in category_counts if category)
     
     return CategoryResponse(categories=categories)
 
-@router.get("/products/featured", response_model=ProductsResponse)
-def get_featured_products(limit: int = Query(8, ge=1, le=20)) -> ProductsResponse:
-    """Get featured products"""
-    all_products = products_db.get_all()
+@router.get("/products/facets", response_model=ProductFacetsResponse)
+def get_product_facets(
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    featured: Optional[bool] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    supplier_id: Optional[str] = None,
+    fuzzy: bool = Query(False, description="Match product names tolerating typos and spelling variants")
+) -> ProductFacetsResponse:
+    """Get product counts per category, supplier and price bucket, optionally scoped by listing filters"""
+    # Without filters the counts are read off the facet index; with them only the matches are tallied
+    where, ranges = listing_filters(category, featured, min_price, max_price, supplier_id)
+    facets = products_db.facet_counts(where=where, ranges=ranges, search=search or None, fuzzy=fuzzy)
     
-    # Filter featured products
-    featured_products = [p for p in all_products if p.get("featured", False)]
+    bucket_counts = facets.counts["price_bucket"]
+    bounds = PRICE_BUCKET_BOUNDS + [None]
+    price_buckets = [
+        PriceBucket(min=low, max=high, count=bucket_counts.get(low, 0))
+        for low, high in zip(bounds, bounds[1:])
+    ]
     
-    # Sort by createdAt (newest first)
-    featured_products.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
+    categories = sorted((str(category), count) for category, count in facets.counts["category"].items() if category)
     
-    # Limit the number of products
-    limited_products = featured_products[:limit]
+    return ProductFacetsResponse(
+        total=facets.total,
+        categories=dict(categories),
+        suppliers=dict(sorted((str(supplier), count) for supplier, count in facets.counts["supplier_id"].items())),
+        priceBuckets=price_buckets,
+        featured=facets.counts["featured"].get(True, 0)
+    )
+
+@router.get("/products/featured", response_model=ProductsResponse)
+def get_featured_products(limit: int = Query(8, ge=1, le=20)) -> ProductsResponse:
+    """Get featured products"""
+    # Newest featured products first, read from the featured index bucket
+    result = products_db.select(
+        where={"featured": True},
+        sort_by="createdAt",
+        descending=True,
+        limit=limit
+    )
     
     return ProductsResponse(
-        products=[Product.parse_obj(product) for product in limited_products],
-        total=len(featured_products)
+        products=[Product.parse_obj(product) for product in result.items],
+        total=result.total
     )
 
 # Dynamic path parameters like {product_id} should be defined AFTER specific routes
@@ -233,10 +379,23 @@ def update_product(product_id: str, update_data: ProductUpdate) -> ProductRespon
     updates = {k: v for k, v in update_data.dict().items() if v is not None}
     updates["updatedAt"] = get_timestamp()
     
+    if "images" in updates:
+        try:
+            updates["images"] = offload_product_images(product_id, normalize_product_images(updates["images"]))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            print(f"Error storing images for product {product_id}: {e}")
+            raise HTTPException(status_code=500, detail="Failed to save product images")
+    
     # Update product
     if not products_db.update(product_id, updates):
         raise HTTPException(status_code=500, detail="Failed to update product")
     
+    # Drop assets of images that were removed
+    if "images" in updates:
+        delete_product_images(product_id, product.get("images", []), updates["images"])
+    
     # Get updated product
     updated_product = products_db.get_by_id(product_id)
     
@@ -254,4 +413,6 @@ def delete_product(product_id: str) -> Dict[str, Any]:
     if not products_db.delete(product_id):
         raise HTTPException(status_code=500, detail="Failed to delete product")
     
+    delete_product_images(product_id, product.get("images", []))
+    
     return {"success": True, "message": "Product deleted successfully"}
@@ -5,7 +5,7 @@ from datetime import datetime
 import databutton as db
 import re
 import statistics
-from app.apis.database import generate_id, get_timestamp, products as products_db, users as users_db, orders as orders_db
+from app.apis.database import generate_id, get_timestamp, products as products_db, users as users_db, orders as orders_db, order_item_product_id
 
 # Initialize router
 router = APIRouter()
@@ -80,13 +80,8 @@ def create_review(review_data: ReviewCreate) -> ReviewResponse:
             raise HTTPException(status_code=403, detail="You can only review products from your own orders")
         
         # Check if product is in order
-        product_in_order = False
-        for item in order.get("items", []):
-            if item.get("id") == review_data.productId:
-                product_in_order = True
-                break
-        
-        if not product_in_order:
+        ordered_ids = {order_item_product_id(item) for item in order.get("items", [])}
+        if review_data.productId not in ordered_ids:
             raise HTTPException(status_code=400, detail="You can only review products you've purchased")
     
     # Create review
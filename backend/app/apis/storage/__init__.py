@@ -0,0 +1,701 @@
+import base64
+import binascii
+import databutton as db
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from typing import List, Dict, Any, Optional, Tuple, Union
+from fastapi import APIRouter
+
+# Optional fast serializers; collections fall back to stdlib json without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Utility module - storage engines behind database.Collection, no endpoints
+router = APIRouter(tags=["storage-utils"])
+
+# Storage modes for collections
+SNAPSHOT_MODE = "snapshot"  # whole collection re-written as one JSON blob on every write
+LOG_MODE = "log"  # mutations appended as JSON lines to <name>.log, compacted into the blob
+
+# Storage backend names, selected with the STORAGE_BACKEND environment variable
+DATABUTTON_BACKEND = "databutton"
+SQLITE_BACKEND = "sqlite"
+
+# Codec names for serializing collection snapshots
+JSON_CODEC = "json"  # stdlib json, text storage (the original format)
+ORJSON_CODEC = "orjson"  # orjson, text storage, byte-for-byte compatible JSON documents
+MSGPACK_CODEC = "msgpack"  # msgpack, binary storage under <name>.bin
+
+# Snapshot compression; compressed snapshots are stored under <name>.bin
+NO_COMPRESSION = "none"
+GZIP_COMPRESSION = "gzip"
+ZSTD_COMPRESSION = "zstd"
+
+# Magic numbers at the start of compressed payloads, used to detect the compression on read
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Sanitize storage key to only allow alphanumeric and ._- symbols
+def sanitize_storage_key(key: str) -> str:
+    """Sanitize storage key to only allow alphanumeric and ._- symbols"""
+    return re.sub(r'[^a-zA-Z0-9._-]', '', key)
+
+# Data URLs as sent by the frontend's FileReader.readAsDataURL, e.g. data:image/png;base64,....
+DATA_URL_PATTERN = re.compile(r'data:([\w.+-]+/[\w.+-]+)?((?:;[\w.+-]+=[\w.+-]+)*);base64,(.*)', re.DOTALL)
+
+# Content types that may be stored from uploads and served back from the API origin.
+# Anything a browser would render as a document (HTML, SVG, XML) is excluded.
+RASTER_IMAGE_TYPES = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp", "image/avif", "image/bmp"})
+
+# Headers sent with every uploaded file served by the API, so browsers use the declared type
+UPLOAD_RESPONSE_HEADERS = {"X-Content-Type-Options": "nosniff"}
+
+def is_data_url(value: Any) -> bool:
+    """Check whether a value is an inline base64 data URL"""
+    return isinstance(value, str) and value.startswith('data:')
+
+def parse_data_url(value: str) -> Optional[Tuple[str, bytes]]:
+    """Decode a base64 data URL into (content type, bytes); None if it is not one"""
+    if not is_data_url(value):
+        return None
+    match = DATA_URL_PATTERN.fullmatch(value.strip())
+    if not match:
+        return None
+    try:
+        content = base64.b64decode(match.group(3), validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    return match.group(1) or "application/octet-stream", content
+
+# Prefix of the routes the API mounts its routers under; stored references to served files start with it
+API_ROUTES_PREFIX = "/routes"
+
+# Public URL of the API routes as browsers reach them, e.g.
+# https://api.databutton.com/_projects/<project>/dbtn/prodx/app/routes
+# (the frontend's API_URL); without it references are returned as /routes/... paths
+PUBLIC_API_URL = os.environ.get("PUBLIC_API_URL", "").rstrip("/")
+
+def public_api_url(reference: Any) -> Any:
+    """Turn a stored /routes/... reference into the absolute URL browsers load it from"""
+    if PUBLIC_API_URL and isinstance(reference, str) and reference.startswith(API_ROUTES_PREFIX + "/"):
+        return PUBLIC_API_URL + reference[len(API_ROUTES_PREFIX):]
+    return reference
+
+def api_route_reference(url: Any) -> Any:
+    """Turn a URL from public_api_url back into the /routes/... reference that is stored"""
+    if PUBLIC_API_URL and isinstance(url, str) and url.startswith(PUBLIC_API_URL + "/"):
+        return API_ROUTES_PREFIX + url[len(PUBLIC_API_URL):]
+    return url
+
+class GenerationConflict(Exception):
+    """Raised when a write expected a generation that is no longer the stored one"""
+    pass
+
+# Add counter deltas to a document
+def apply_increments(doc: Dict[str, Any], deltas: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of doc with each delta added to its field (a missing or null field counts as 0)"""
+    doc = dict(doc)
+    for field, delta in deltas.items():
+        doc[field] = (doc.get(field) or 0) + delta
+    return doc
+
+# Replay log records on top of a snapshot
+def replay_log_records(data: List[Dict[str, Any]], records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Apply delta records to a list of documents and return the resulting list
+
+    An add always appends, as Collection.add does, so two documents added with the
+    same id both survive; records must therefore be replayed exactly once.
+    """
+    docs = list(data)
+    positions = {}
+    def index_positions():
+        positions.clear()
+        for i, item in enumerate(docs):
+            if item.get('id') is not None:
+                positions.setdefault(item['id'], i)
+    index_positions()
+
+    for record in records:
+        op = record.get('op')
+        if op == 'add':
+            doc = record['doc']
+            if doc.get('id') is not None:
+                positions.setdefault(doc['id'], len(docs))
+            docs.append(doc)
+        elif op == 'update':
+            position = positions.get(record['id'])
+            if position is not None:
+                docs[position] = {**docs[position], **record['changes']}
+                if 'id' in record['changes']:
+                    index_positions()
+        elif op == 'increment':
+            position = positions.get(record['id'])
+            if position is not None:
+                docs[position] = apply_increments(docs[position], record['deltas'])
+        elif op == 'delete':
+            docs = [item for item in docs if item.get('id') != record['id']]
+            index_positions()
+        else:
+            print(f"Skipping unknown log record: {record}")
+    return docs
+
+# Serialization codecs
+class Codec:
+    """Serializes a collection snapshot to text (text storage) or bytes (binary storage)"""
+    name = ""
+    binary = False
+
+    def dumps(self, data: Any) -> Union[str, bytes]:
+        raise NotImplementedError
+
+    def loads(self, raw: Union[str, bytes]) -> Any:
+        raise NotImplementedError
+
+class JsonCodec(Codec):
+    """Standard library json"""
+    name = JSON_CODEC
+
+    def dumps(self, data: Any) -> str:
+        return json.dumps(data)
+
+    def loads(self, raw: Union[str, bytes]) -> Any:
+        return json.loads(raw)
+
+class OrjsonCodec(Codec):
+    """orjson - same JSON on disk, several times faster to parse and dump"""
+    name = ORJSON_CODEC
+
+    def dumps(self, data: Any) -> str:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, raw: Union[str, bytes]) -> Any:
+        return orjson.loads(raw)
+
+class MsgpackCodec(Codec):
+    """msgpack - compact binary encoding stored in Databutton binary storage"""
+    name = MSGPACK_CODEC
+    binary = True
+
+    def dumps(self, data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, raw: Union[str, bytes]) -> Any:
+        return msgpack.unpackb(raw, raw=False)
+
+_codecs: Dict[str, Codec] = {JSON_CODEC: JsonCodec()}
+if orjson is not None:
+    _codecs[ORJSON_CODEC] = OrjsonCodec()
+if msgpack is not None:
+    _codecs[MSGPACK_CODEC] = MsgpackCodec()
+
+def get_codec(name: Optional[str] = None, fallback: bool = False) -> Codec:
+    """Get a codec by name (stdlib json when name is empty)
+
+    With fallback=True an unavailable optional codec degrades to stdlib json, which is
+    what writers want; readers must decode the stored format and use the default.
+    """
+    name = name or JSON_CODEC
+    if name in _codecs:
+        return _codecs[name]
+    if name in (ORJSON_CODEC, MSGPACK_CODEC):
+        if fallback:
+            print(f"Codec {name} is not installed, using {JSON_CODEC}")
+            return _codecs[JSON_CODEC]
+        raise RuntimeError(f"Codec {name} is required to read this collection but is not installed")
+    raise ValueError(f"Unknown codec: {name}")
+
+# Snapshot compression
+def get_compression(name: Optional[str] = None) -> str:
+    """Resolve a compression name, degrading zstd to gzip when zstandard is not installed"""
+    name = name or NO_COMPRESSION
+    if name not in (NO_COMPRESSION, GZIP_COMPRESSION, ZSTD_COMPRESSION):
+        raise ValueError(f"Unknown compression: {name}")
+    if name == ZSTD_COMPRESSION and zstandard is None:
+        print(f"Compression {name} is not installed, using {GZIP_COMPRESSION}")
+        return GZIP_COMPRESSION
+    return name
+
+def compress_payload(payload: bytes, compression: str) -> bytes:
+    """Compress a payload; the result starts with the format's magic number"""
+    if compression == ZSTD_COMPRESSION:
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    if compression == GZIP_COMPRESSION:
+        return gzip.compress(payload, compresslevel=6)
+    return payload
+
+def decompress_payload(raw: bytes) -> bytes:
+    """Decompress a payload by its header; payloads without a known header are returned as-is"""
+    if raw.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this collection but is not installed")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+    if raw.startswith(GZIP_MAGIC):
+        return gzip.decompress(raw)
+    return raw
+
+class CollectionStore:
+    """Storage for a single collection
+
+    A store reads and writes the documents of one collection and exposes a generation
+    token that changes on every write, which Collection uses to validate its cache.
+    write() receives the full new document list plus, when known, the delta records
+    that produced it, so engines can persist only the change. Passing
+    expected_generation makes the write conditional: it raises GenerationConflict
+    instead of overwriting a collection that changed since it was read.
+    """
+    def __init__(self, name: str):
+        self.name = sanitize_storage_key(name)
+
+    def generation(self) -> str:
+        """Get the generation token of the stored documents"""
+        raise NotImplementedError
+
+    def version(self) -> str:
+        """Get a token that changes whenever the stored documents do
+
+        This is the generation token; engines that can hold documents written
+        without one (e.g. keys put straight into Databutton storage) override it.
+        """
+        return self.generation()
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Load all stored documents"""
+        raise NotImplementedError
+
+    def write(self, data: List[Dict[str, Any]], records: Optional[List[Dict[str, Any]]] = None,
+              expected_generation: Optional[str] = None) -> str:
+        """Persist documents and return the new generation token; raises on failure"""
+        raise NotImplementedError
+
+    def pending_records(self) -> int:
+        """Number of delta records not yet folded into a snapshot"""
+        return 0
+
+    def reset(self) -> None:
+        """Forget any state cached from the last load or write"""
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Engine-specific statistics about the last load or write"""
+        return {}
+
+class StorageBackend:
+    """Storage engine that hands out per-collection stores
+
+    Engines also hold binary objects (payment proofs, product images) outside the
+    collections, so documents only carry a reference to them.
+    """
+    name = ""
+
+    def put_blob(self, key: str, content: bytes, content_type: str) -> None:
+        """Store a binary object; raises on failure"""
+        raise NotImplementedError
+
+    def get_blob(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Get a binary object as (content, content type), or None if it does not exist"""
+        raise NotImplementedError
+
+    def delete_blob(self, key: str) -> None:
+        """Delete a binary object if it exists"""
+        raise NotImplementedError
+
+    def open(self, name: str, storage_mode: str = SNAPSHOT_MODE,
+             codec: Optional[str] = None, compression: Optional[str] = None) -> CollectionStore:
+        """Get the store for a collection"""
+        raise NotImplementedError
+
+# Databutton blob storage
+class BlobCollectionStore(CollectionStore):
+    """Collection stored as a blob in Databutton storage
+
+    The snapshot lives under the collection name as text, or under <name>.bin when
+    the codec is binary or compression is enabled. A small <name>.meta key holds the
+    generation token plus the codec and location the snapshot was written with.
+    Readers follow the meta, and detect compression from the payload header, so
+    changing a collection's codec or compression takes effect on its next full
+    write while older blobs (including legacy ones without meta) keep reading.
+
+    In LOG_MODE mutations are appended as JSON lines to <name>.log and folded back
+    into the snapshot by compaction; readers replay snapshot + log. Databutton
+    storage has no append primitive, so the log key is re-written per mutation,
+    which keeps write cost bounded by the log length rather than the collection
+    size. The log is never compressed. Before compaction writes the snapshot, the
+    meta records its digest and how many log records it holds; readers that find
+    that snapshot skip those records, so a crash before the log is cleared does
+    not replay them twice.
+
+    Databutton storage has no conditional put either, so the generation check is a
+    read immediately before the write: it catches lost updates between requests
+    but leaves a small window between the check and the put.
+    """
+    def __init__(self, name: str, storage_mode: str = SNAPSHOT_MODE, codec: Optional[str] = None,
+                 compression: Optional[str] = None):
+        super().__init__(name)
+        if storage_mode not in (SNAPSHOT_MODE, LOG_MODE):
+            raise ValueError(f"Unknown storage mode: {storage_mode}")
+        self.storage_mode = storage_mode
+        self.codec = get_codec(codec, fallback=True)
+        self.compression = get_compression(compression)
+        self.meta_key = sanitize_storage_key(f"{name}.meta")
+        self.log_key = sanitize_storage_key(f"{name}.log")
+        self.binary_key = sanitize_storage_key(f"{name}.bin")
+        self._log_text: Optional[str] = None
+        self._log_records = 0
+        # Leading log records already contained in the snapshot
+        self._log_offset = 0
+        # Format and location of the stored snapshot, carried into meta on log appends
+        self._snapshot_meta: Optional[Dict[str, Any]] = None
+        self._last_write: Dict[str, Any] = {}
+
+    def _read_meta(self) -> Dict[str, Any]:
+        return json.loads(db.storage.text.get(self.meta_key, default="{}"))
+
+    @staticmethod
+    def _snapshot_fields(meta: Dict[str, Any]) -> Dict[str, Any]:
+        snapshot_format = meta.get('format') or JSON_CODEC
+        # Metas written before compression existed have no location: binary codecs imply .bin
+        binary = meta.get('binary', get_codec(snapshot_format).binary)
+        return {"format": snapshot_format, "binary": binary}
+
+    def generation(self) -> str:
+        return self._read_meta().get('generation', '')
+
+    def version(self) -> str:
+        generation = self.generation()
+        if generation:
+            return generation
+        # Keys put straight into storage (legacy order keys) have no meta: hash their text instead
+        content = db.storage.text.get(self.name, default="")
+        return f"sha1-{hashlib.sha1(content.encode()).hexdigest()}" if content else ''
+
+    def _read_snapshot(self, snapshot_meta: Dict[str, Any]) -> Union[str, bytes]:
+        if snapshot_meta['binary']:
+            return db.storage.binary.get(self.binary_key, default=b"")
+        return db.storage.text.get(self.name, default="")
+
+    def _decode_snapshot(self, snapshot_meta: Dict[str, Any], raw: Union[str, bytes]) -> Any:
+        if not raw:
+            return []
+        codec = get_codec(snapshot_meta['format'])
+        if snapshot_meta['binary']:
+            payload = decompress_payload(raw)
+            return codec.loads(payload if codec.binary else payload.decode())
+        return codec.loads(raw)
+
+    @staticmethod
+    def _digest(raw: Union[str, bytes]) -> str:
+        return hashlib.sha1(raw.encode() if isinstance(raw, str) else raw).hexdigest()
+
+    def load(self) -> List[Dict[str, Any]]:
+        meta = self._read_meta()
+        snapshot_meta = self._snapshot_fields(meta)
+        log_offset = meta.get('logOffset', 0)
+        raw = None
+        compaction = meta.get('compaction')
+        if compaction and self.storage_mode == LOG_MODE:
+            # A compaction that may not have finished: its snapshot counts only if it was written
+            compacted_meta = self._snapshot_fields(compaction)
+            raw = self._read_snapshot(compacted_meta)
+            if raw and self._digest(raw) == compaction.get('digest'):
+                snapshot_meta, log_offset = compacted_meta, compaction.get('records', 0)
+            elif compacted_meta != snapshot_meta:
+                raw = None
+        if raw is None:
+            raw = self._read_snapshot(snapshot_meta)
+        data = self._decode_snapshot(snapshot_meta, raw)
+        self._snapshot_meta = snapshot_meta
+        if self.storage_mode == LOG_MODE:
+            log_text = db.storage.text.get(self.log_key, default="")
+            log_codec = self.codec if not self.codec.binary else get_codec(JSON_CODEC)
+            records = [log_codec.loads(line) for line in log_text.splitlines() if line.strip()]
+            self._log_offset = min(log_offset, len(records))
+            data = replay_log_records(data, records[self._log_offset:])
+            self._log_text = log_text
+            self._log_records = len(records) - self._log_offset
+        return data
+
+    def _encode_snapshot(self, data: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Union[str, bytes]]:
+        """Serialize a snapshot; returns its meta fields and the payload as it is stored"""
+        payload = self.codec.dumps(data)
+        if not self.codec.binary and self.compression == NO_COMPRESSION:
+            self._last_write = {"bytes": len(payload)}
+            return {"format": self.codec.name, "binary": False}, payload
+        raw = payload if self.codec.binary else payload.encode()
+        blob = compress_payload(raw, self.compression)
+        self._last_write = {"bytes": len(blob)}
+        if self.compression != NO_COMPRESSION:
+            ratio = len(raw) / len(blob) if blob else 1.0
+            self._last_write.update({
+                "uncompressedBytes": len(raw),
+                "compression": self.compression,
+                "compressionRatio": round(ratio, 2)
+            })
+            print(f"Saved {self.name}: {len(raw)} -> {len(blob)} bytes ({self.compression}, ratio {ratio:.2f})")
+        return {"format": self.codec.name, "binary": True}, blob
+
+    def _write_snapshot(self, snapshot_meta: Dict[str, Any], stored: Union[str, bytes]) -> None:
+        if snapshot_meta['binary']:
+            db.storage.binary.put(self.binary_key, stored)
+        else:
+            db.storage.text.put(self.name, stored)
+        self._snapshot_meta = snapshot_meta
+
+    def write(self, data: List[Dict[str, Any]], records: Optional[List[Dict[str, Any]]] = None,
+              expected_generation: Optional[str] = None) -> str:
+        meta = None
+        if expected_generation is not None:
+            meta = self._read_meta()
+            if meta.get('generation', '') != expected_generation:
+                raise GenerationConflict(f"{self.name} changed since it was read")
+        if self.storage_mode == LOG_MODE and records is not None:
+            if self._log_text is None or self._snapshot_meta is None:
+                # The log offset and snapshot format come from a load, which checks compactions
+                self.load()
+            # Log lines are always JSON text; the snapshot keeps its current format
+            log_codec = self.codec if not self.codec.binary else get_codec(JSON_CODEC)
+            log_text = self._log_text + "".join(log_codec.dumps(record) + "\n" for record in records)
+            db.storage.text.put(self.log_key, log_text)
+            self._log_text = log_text
+            self._log_records += len(records)
+        else:
+            snapshot_meta, stored = self._encode_snapshot(data)
+            if self.storage_mode == LOG_MODE:
+                if self._log_text is None:
+                    self._log_text = db.storage.text.get(self.log_key, default="")
+                folded = sum(1 for line in self._log_text.splitlines() if line.strip())
+                if folded:
+                    # The new snapshot holds every record in the log; say so before writing it
+                    meta = meta if meta is not None else self._read_meta()
+                    db.storage.text.put(self.meta_key, json.dumps({**meta, "compaction": {
+                        **snapshot_meta, "digest": self._digest(stored), "records": folded}}))
+            self._write_snapshot(snapshot_meta, stored)
+            if self.storage_mode == LOG_MODE:
+                db.storage.text.put(self.log_key, "")
+                self._log_text = ""
+                self._log_records = 0
+                self._log_offset = 0
+        generation = uuid.uuid4().hex
+        meta = {"generation": generation, **self._snapshot_meta}
+        if self._log_offset:
+            meta["logOffset"] = self._log_offset
+        db.storage.text.put(self.meta_key, json.dumps(meta))
+        return generation
+
+    def pending_records(self) -> int:
+        return self._log_records if self.storage_mode == LOG_MODE else 0
+
+    def reset(self) -> None:
+        self._log_text = None
+        self._snapshot_meta = None
+        self._log_offset = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._last_write)
+
+class DatabuttonStorageBackend(StorageBackend):
+    """Whole-collection blobs in Databutton storage (the original engine)
+
+    Binary objects go to Databutton binary storage, with the content type in a
+    <key>.type text key since binary storage keeps bytes only.
+    """
+    name = DATABUTTON_BACKEND
+
+    def put_blob(self, key: str, content: bytes, content_type: str) -> None:
+        key = sanitize_storage_key(key)
+        db.storage.binary.put(key, content)
+        db.storage.text.put(f"{key}.type", content_type)
+
+    def get_blob(self, key: str) -> Optional[Tuple[bytes, str]]:
+        key = sanitize_storage_key(key)
+        content = db.storage.binary.get(key, default=b"")
+        if not content:
+            return None
+        return content, db.storage.text.get(f"{key}.type", default="application/octet-stream")
+
+    def delete_blob(self, key: str) -> None:
+        key = sanitize_storage_key(key)
+        db.storage.binary.delete(key)
+        db.storage.text.delete(f"{key}.type")
+
+    def open(self, name: str, storage_mode: str = SNAPSHOT_MODE,
+             codec: Optional[str] = None, compression: Optional[str] = None) -> CollectionStore:
+        return BlobCollectionStore(name, storage_mode, codec, compression)
+
+# Local SQLite storage
+class SQLiteCollectionStore(CollectionStore):
+    """Collection stored as one SQLite row per document
+
+    Rows keep insertion order through an autoincrement seq column and hold the
+    document as a JSON column. Delta records are applied row by row, so a write
+    touches only the changed documents; storage_mode and compression do not apply. The generation
+    check and bump happen in the same IMMEDIATE transaction as the change, so
+    conditional writes are atomic across processes sharing the database file.
+    """
+    def __init__(self, backend: "SQLiteStorageBackend", name: str, codec: Optional[str] = None):
+        super().__init__(name)
+        self.backend = backend
+        # Bodies must stay JSON (the table checks json_valid), so binary codecs fall back to json
+        self.codec = get_codec(codec, fallback=True)
+        if self.codec.binary:
+            self.codec = get_codec(JSON_CODEC)
+
+    def generation(self) -> str:
+        with self.backend.lock:
+            row = self.backend.conn.execute(
+                "SELECT generation FROM collections WHERE name = ?", (self.name,)).fetchone()
+        return row[0] if row else ''
+
+    def load(self) -> List[Dict[str, Any]]:
+        with self.backend.lock:
+            rows = self.backend.conn.execute(
+                "SELECT body FROM documents WHERE collection = ? ORDER BY seq", (self.name,)).fetchall()
+        return [self.codec.loads(row[0]) for row in rows]
+
+    def _insert(self, conn: sqlite3.Connection, doc: Dict[str, Any]) -> None:
+        doc_id = doc.get('id')
+        conn.execute("INSERT INTO documents (collection, id, body) VALUES (?, ?, ?)",
+                     (self.name, None if doc_id is None else str(doc_id), self.codec.dumps(doc)))
+
+    def _apply_record(self, conn: sqlite3.Connection, record: Dict[str, Any]) -> None:
+        op = record.get('op')
+        if op == 'add':
+            self._insert(conn, record['doc'])
+        elif op in ('update', 'increment'):
+            row = conn.execute(
+                "SELECT seq, body FROM documents WHERE collection = ? AND id = ? ORDER BY seq LIMIT 1",
+                (self.name, str(record['id']))).fetchone()
+            if row:
+                doc = self.codec.loads(row[1])
+                if op == 'update':
+                    doc = {**doc, **record['changes']}
+                else:
+                    doc = apply_increments(doc, record['deltas'])
+                doc_id = doc.get('id')
+                conn.execute("UPDATE documents SET id = ?, body = ? WHERE seq = ?",
+                             (None if doc_id is None else str(doc_id), self.codec.dumps(doc), row[0]))
+        elif op == 'delete':
+            conn.execute("DELETE FROM documents WHERE collection = ? AND id = ?",
+                         (self.name, str(record['id'])))
+        else:
+            raise ValueError(f"Unknown record op: {op}")
+
+    def write(self, data: List[Dict[str, Any]], records: Optional[List[Dict[str, Any]]] = None,
+              expected_generation: Optional[str] = None) -> str:
+        generation = uuid.uuid4().hex
+        with self.backend.lock:
+            conn = self.backend.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if expected_generation is not None:
+                    row = conn.execute(
+                        "SELECT generation FROM collections WHERE name = ?", (self.name,)).fetchone()
+                    if (row[0] if row else '') != expected_generation:
+                        raise GenerationConflict(f"{self.name} changed since it was read")
+                if records is not None:
+                    for record in records:
+                        self._apply_record(conn, record)
+                else:
+                    conn.execute("DELETE FROM documents WHERE collection = ?", (self.name,))
+                    for doc in data:
+                        self._insert(conn, doc)
+                conn.execute(
+                    "INSERT INTO collections (name, generation) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET generation = excluded.generation",
+                    (self.name, generation))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return generation
+
+class SQLiteStorageBackend(StorageBackend):
+    """Single-file SQLite engine for running the shop on one node without Databutton storage"""
+    name = SQLITE_BACKEND
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "collection TEXT NOT NULL, "
+                "id TEXT, "
+                "body TEXT NOT NULL CHECK (json_valid(body)))")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_documents_collection_id ON documents (collection, id)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS collections (name TEXT PRIMARY KEY, generation TEXT NOT NULL)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "key TEXT PRIMARY KEY, content_type TEXT NOT NULL, content BLOB NOT NULL)")
+            # Collections are queried from their in-memory indexes, so JSON expression
+            # indexes left by older versions only slow writes down
+            for (index_name,) in self.conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'documents' "
+                    "AND sql LIKE '%json_extract%'").fetchall():
+                self.conn.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+
+    def open(self, name: str, storage_mode: str = SNAPSHOT_MODE,
+             codec: Optional[str] = None, compression: Optional[str] = None) -> CollectionStore:
+        return SQLiteCollectionStore(self, name, codec)
+
+    def put_blob(self, key: str, content: bytes, content_type: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO blobs (key, content_type, content) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET content_type = excluded.content_type, content = excluded.content",
+                (sanitize_storage_key(key), content_type, sqlite3.Binary(content)))
+
+    def get_blob(self, key: str) -> Optional[Tuple[bytes, str]]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content, content_type FROM blobs WHERE key = ?", (sanitize_storage_key(key),)).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+
+    def delete_blob(self, key: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM blobs WHERE key = ?", (sanitize_storage_key(key),))
+
+# Active storage backend, created on first use from the environment
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+def get_storage_backend() -> StorageBackend:
+    """Get the configured storage backend
+
+    STORAGE_BACKEND selects the engine ("databutton" by default, or "sqlite");
+    SQLITE_DB_PATH sets the database file for the SQLite engine.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            backend_name = os.environ.get("STORAGE_BACKEND", DATABUTTON_BACKEND).lower()
+            if backend_name == SQLITE_BACKEND:
+                _backend = SQLiteStorageBackend(os.environ.get("SQLITE_DB_PATH", "ahadu.sqlite3"))
+            elif backend_name == DATABUTTON_BACKEND:
+                _backend = DatabuttonStorageBackend()
+            else:
+                raise ValueError(f"Unknown storage backend: {backend_name}")
+            print(f"Using {_backend.name} storage backend")
+        return _backend
@@ -115,34 +115,29 @@ def get_suppliers(
     limit: int = Query(20, ge=1, le=100)
 ) -> SuppliersListResponse:
     """Get all suppliers with filtering and pagination (admin only)"""
-    # Get all users
-    all_users = users_db.get_all()
-    
-    # Filter suppliers only
-    suppliers = [user for user in all_users if user.get("role") == "supplier"]
-    
-    # Filter by status if provided
+    # Suppliers only, with status answered from indexes and search as a predicate
+    where = {"role": "supplier"}
     if status:
-        suppliers = [s for s in suppliers if s.get("status") == status]
+        where["status"] = status
     
-    # Filter by search term if provided
+    filters = []
     if search:
         search_lower = search.lower()
-        suppliers = [s for s in suppliers if 
-                    search_lower in s.get("name", "").lower() or 
-                    search_lower in s.get("email", "").lower() or
-                    search_lower in s.get("company", "").lower()]
-    
-    # Sort by creation date (newest first)
-    suppliers.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
-    
-    # Calculate pagination
-    total = len(suppliers)
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    
-    # Get paginated suppliers
-    paginated_suppliers = suppliers[start_idx:end_idx]
+        filters.append(lambda s: search_lower in s.get("name", "").lower() or
+                       search_lower in s.get("email", "").lower() or
+                       search_lower in s.get("company", "").lower())
+    
+    # Newest first, selecting only the requested page
+    result = users_db.select(
+        where=where,
+        filters=filters,
+        sort_by="createdAt",
+        descending=True,
+        offset=(page - 1) * limit,
+        limit=limit
+    )
+    total = result.total
+    paginated_suppliers = result.items
     
     # Convert to response format
     supplier_list = []
@@ -257,14 +252,12 @@ def get_supplier_products(supplier_id: str) -> dict:
     # and by admins to view products for a specific supplier
     from app.apis.database import products as products_db
     
-    # Get all products
-    all_products = products_db.get_all()
-    
-    # Filter by supplier ID
-    supplier_products = [p for p in all_products if p.get("supplierId") == supplier_id]
-    
-    # Sort by creation date (newest first)
-    supplier_products.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
+    # The supplier's products from the supplier index, newest first
+    supplier_products = products_db.select(
+        where={"supplier_id": supplier_id},
+        sort_by="createdAt",
+        descending=True
+    ).items
     
     # Convert to response format with simplified data
     products_list = []
@@ -289,37 +282,30 @@ def get_supplier_orders(supplier_id: str) -> dict:
     """Get orders containing products from a specific supplier (supplier dashboard)"""
     # This endpoint can be used by suppliers to view orders for their products
     # and by admins to view orders for a specific supplier
-    from app.apis.database import orders as orders_db, products as products_db
-    
-    # Get all products for this supplier
-    all_products = products_db.get_all()
-    supplier_products = [p for p in all_products if p.get("supplierId") == supplier_id]
-    
-    # Get all orders
-    all_orders = orders_db.get_all()
+    from app.apis.database import orders as orders_db, products as products_db, order_item_product_id
     
-    # Filter orders that contain products from this supplier
-    supplier_product_ids = [p["id"] for p in supplier_products]
+    # The supplier's products come from the supplier index, their orders from the product index
+    supplier_product_ids = {p["id"] for p in products_db.find("supplier_id", supplier_id) if p.get("id")}
     supplier_orders = []
     
-    for order in all_orders:
-        # Check if any item in the order is from this supplier
-        order_items = order.get("items", [])
-        supplier_items = [item for item in order_items if item.get("productId") in supplier_product_ids]
+    # One probe of the product index for all the supplier's products; each order comes back once
+    for order in orders_db.find_any("product_id", supplier_product_ids):
+        # Only this supplier's items of the order
+        supplier_items = [item for item in order.get("items", [])
+                          if order_item_product_id(item) in supplier_product_ids]
         
-        if supplier_items:
-            # Calculate supplier subtotal for this order
-            supplier_subtotal = sum(item.get("price", 0) * item.get("quantity", 0) for item in supplier_items)
-            
-            # Add relevant order information for the supplier
-            supplier_orders.append({
-                "id": order["id"],
-                "supplierItems": supplier_items,
-                "supplierSubtotal": supplier_subtotal,
-                "orderStatus": order.get("status"),
-                "shippingInfo": order.get("shippingInfo", {}),
-                "createdAt": order.get("createdAt"),
-            })
+        # Calculate supplier subtotal for this order
+        supplier_subtotal = sum(item.get("price", 0) * item.get("quantity", 0) for item in supplier_items)
+        
+        # Add relevant order information for the supplier
+        supplier_orders.append({
+            "id": order["id"],
+            "supplierItems": supplier_items,
+            "supplierSubtotal": supplier_subtotal,
+            "orderStatus": order.get("status"),
+            "shippingInfo": order.get("shippingInfo", {}),
+            "createdAt": order.get("createdAt"),
+        })
     
     # Sort by creation date (newest first)
     supplier_orders.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
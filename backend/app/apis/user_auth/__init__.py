@@ -5,7 +5,7 @@ import uuid
 from datetime import datetime
 import bcrypt
 import databutton as db
-from app.apis.database import users, addresses, generate_id, get_timestamp
+from app.apis.database import users, addresses, generate_id, get_timestamp, CollectionWriteError
 
 router = APIRouter()
 
@@ -163,13 +163,6 @@ def create_address(address_data: AddressCreate, user_id: str) -> AddressResponse
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # If marked as default, update any existing default address
-    if address_data.isDefault:
-        user_addresses = addresses.get_by_user_id(user_id)
-        for addr in user_addresses:
-            if addr.get("isDefault"):
-                addresses.update(addr["id"], {"isDefault": False})
-    
     # Create new address
     new_address = {
         "id": generate_id("addr"),
@@ -185,8 +178,16 @@ def create_address(address_data: AddressCreate, user_id: str) -> AddressResponse
         "createdAt": datetime.now().isoformat()
     }
     
-    # Store in database
-    addresses.add(new_address)
+    # Store in database, clearing any existing default address in the same write
+    try:
+        with addresses.unit_of_work():
+            if address_data.isDefault:
+                previous_defaults = {addr["id"]: {"isDefault": False}
+                                     for addr in addresses.get_by_user_id(user_id) if addr.get("isDefault")}
+                addresses.bulk_update(previous_defaults)
+            addresses.add(new_address)
+    except CollectionWriteError:
+        raise HTTPException(status_code=500, detail="Failed to save address")
     
     return AddressResponse(**new_address)
 
@@ -209,7 +210,7 @@ def migrate_local_users(user_list: List[dict]) -> dict:
     existing_users = users.get_all()
     existing_emails = {user['email'].lower() for user in existing_users}
     
-    migrated_count = 0
+    new_users = []
     for user_data in user_list:
         # Skip users that already exist
         if user_data.get('email', '').lower() in existing_emails:
@@ -231,9 +232,12 @@ def migrate_local_users(user_list: List[dict]) -> dict:
         if 'status' not in user_data:
             user_data['status'] = "active"
             
-        # Add to database
-        users.add(user_data)
+        new_users.append(user_data)
         existing_emails.add(user_data.get('email', '').lower())
-        migrated_count += 1
     
+    # Add all migrated users to the database in a single write
+    if new_users and not users.bulk_add(new_users):
+        raise HTTPException(status_code=500, detail="Failed to migrate users")
+    
+    migrated_count = len(new_users)
     return {"migrated": migrated_count, "total": len(existing_users) + migrated_count}
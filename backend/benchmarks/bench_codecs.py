@@ -0,0 +1,82 @@
+"""Benchmark collection serialization codecs
+
+Times dumps/loads for every installed codec over synthetic order documents shaped
+like the ones the shop stores, at 10k and 100k documents. Run from the backend
+directory:
+
+    python -m benchmarks.bench_codecs
+"""
+import random
+import time
+from typing import List, Dict, Any
+
+from app.apis.storage import get_codec, JSON_CODEC, ORJSON_CODEC, MSGPACK_CODEC
+
+SIZES = [10_000, 100_000]
+REPEATS = 3
+
+STATUSES = ["pending", "processing", "shipped", "delivered", "cancelled"]
+
+# Generate orders resembling the ones written by the orders API
+def make_orders(count: int) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    orders = []
+    for i in range(count):
+        items = [
+            {
+                "productId": f"prod-{rng.randint(1, 2000)}",
+                "name": f"Product {rng.randint(1, 2000)}",
+                "price": round(rng.uniform(5, 500), 2),
+                "quantity": rng.randint(1, 5),
+            }
+            for _ in range(rng.randint(1, 4))
+        ]
+        orders.append({
+            "id": f"ord-{i:08d}",
+            "userId": f"user-{rng.randint(1, 5000)}",
+            "items": items,
+            "total": round(sum(item["price"] * item["quantity"] for item in items), 2),
+            "status": rng.choice(STATUSES),
+            "shippingInfo": {
+                "fullName": f"Customer {i}",
+                "email": f"customer{i}@example.com",
+                "phone": f"+2519{rng.randint(10000000, 99999999)}",
+                "address": f"{rng.randint(1, 999)} Bole Road",
+                "city": "Addis Ababa",
+            },
+            "paymentMethod": rng.choice(["cash", "bank_transfer", "telebirr"]),
+            "createdAt": "2026-10-16T09:00:00",
+            "updatedAt": "2026-10-16T09:00:00",
+        })
+    return orders
+
+# Best-of-N wall time in milliseconds
+def best_ms(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    codecs = []
+    for name in (JSON_CODEC, ORJSON_CODEC, MSGPACK_CODEC):
+        try:
+            codecs.append(get_codec(name))
+        except RuntimeError:
+            print(f"{name}: not installed, skipped")
+
+    print(f"{'docs':>8} {'codec':>8} {'dumps ms':>10} {'loads ms':>10} {'size KB':>10}")
+    for size in SIZES:
+        orders = make_orders(size)
+        for codec in codecs:
+            payload = codec.dumps(orders)
+            assert codec.loads(payload) == orders
+            dumps_ms = best_ms(lambda: codec.dumps(orders))
+            loads_ms = best_ms(lambda: codec.loads(payload))
+            size_kb = len(payload if codec.binary else payload.encode()) / 1024
+            print(f"{size:>8} {codec.name:>8} {dumps_ms:>10.1f} {loads_ms:>10.1f} {size_kb:>10.0f}")
+
+if __name__ == "__main__":
+    main()
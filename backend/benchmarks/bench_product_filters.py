@@ -0,0 +1,101 @@
+"""Benchmark filtered product listings
+
+Runs typical GET /products queries (category, featured, price range, supplier,
+sorted by price or createdAt) three ways at 10k and 50k products: the chained
+list comprehensions and full sort get_products used to run, the index planner of
+Collection.select, and select on the NumPy columnar snapshot. Collections live in
+a throwaway SQLite database. Run from the backend directory:
+
+    python -m benchmarks.bench_product_filters
+"""
+import os
+import random
+import tempfile
+import time
+from typing import List, Dict, Any
+
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+
+from app.apis.database import ProductCollection
+
+SIZES = [10_000, 50_000]
+REPEATS = 5
+CATEGORIES = ["Clothing", "Coffee", "Crafts", "Spices", "Jewelry"]
+QUERIES = [
+    {"category": "Coffee", "min_price": 50, "max_price": 200, "sort_by": "price"},
+    {"featured": True, "max_price": 100, "sort_by": "createdAt"},
+    {"category": "Crafts", "supplier_id": "sup-7", "min_price": 20, "sort_by": "price"},
+    {"min_price": 100, "max_price": 300, "sort_by": "createdAt"},
+]
+
+# Generate products resembling the catalog
+def make_products(count: int) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    return [
+        {
+            "id": f"prod-{i}",
+            "name": f"Product {i}",
+            "price": round(rng.uniform(5, 500), 2),
+            "rating": rng.randint(0, 5),
+            "stock": rng.randint(0, 100),
+            "soldCount": rng.randint(0, 1000),
+            "category": rng.choice(CATEGORIES),
+            "supplierId": f"sup-{rng.randint(1, 40)}",
+            "featured": rng.random() < 0.1,
+            "createdAt": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{i % 24:02d}:00:00",
+        }
+        for i in range(count)
+    ]
+
+# The filter chain get_products ran before the query planner
+def legacy_query(all_products: List[Dict[str, Any]], query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if query.get("category"):
+        all_products = [p for p in all_products if p.get("category") == query["category"]]
+    if query.get("featured") is not None:
+        all_products = [p for p in all_products if p.get("featured") == query["featured"]]
+    if query.get("min_price") is not None:
+        all_products = [p for p in all_products if p.get("price", 0) >= query["min_price"]]
+    if query.get("max_price") is not None:
+        all_products = [p for p in all_products if p.get("price", 0) <= query["max_price"]]
+    if query.get("supplier_id") is not None:
+        all_products = [p for p in all_products if p.get("supplierId") == query["supplier_id"]]
+    all_products.sort(key=lambda x: x.get(query["sort_by"], 0), reverse=True)
+    return all_products[:20]
+
+# The same query through Collection.select, as get_products runs it now
+def select_query(collection: ProductCollection, query: Dict[str, Any]):
+    where = {name: query[name] for name in ("category", "featured", "supplier_id") if query.get(name) is not None}
+    ranges = {}
+    if query.get("min_price") is not None or query.get("max_price") is not None:
+        ranges["price"] = (query.get("min_price"), query.get("max_price"))
+    return collection.select(where=where, ranges=ranges, sort_by=query["sort_by"], descending=True, limit=20)
+
+# Best-of-N wall time in milliseconds
+def best_ms(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    print(f"{'products':>8} {'legacy ms':>10} {'planner ms':>11} {'columnar ms':>12}")
+    for size in SIZES:
+        data = make_products(size)
+        planner = ProductCollection(f"bench_planner_{size}")
+        columnar = ProductCollection(f"bench_columnar_{size}", columnar=True)
+        planner.save_all(data)
+        columnar.save_all(data)
+        # Build the indexes outside the timings
+        for query in QUERIES:
+            select_query(planner, query)
+            select_query(columnar, query)
+        legacy = best_ms(lambda: [legacy_query(planner.get_all(), query) for query in QUERIES])
+        indexed = best_ms(lambda: [select_query(planner, query) for query in QUERIES])
+        vectorized = best_ms(lambda: [select_query(columnar, query) for query in QUERIES])
+        print(f"{size:>8} {legacy:>10.1f} {indexed:>11.1f} {vectorized:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark the products cache-miss read path
+
+Compares loading the catalog with the images normalization that used to run on
+every read against loading it as stored (normalization now happens on write),
+at 10k and 50k products. Run from the backend directory:
+
+    python -m benchmarks.bench_product_reads
+"""
+import random
+import time
+from typing import List, Dict, Any
+
+from app.apis.storage import get_codec, ORJSON_CODEC, JSON_CODEC
+
+SIZES = [10_000, 50_000]
+REPEATS = 5
+
+# Generate products resembling the catalog, with offloaded image references
+def make_products(count: int) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    return [
+        {
+            "id": f"prod-{i}",
+            "name": f"Product {i}",
+            "description": "Handmade in Addis Ababa " * 4,
+            "price": round(rng.uniform(5, 500), 2),
+            "category": rng.choice(["Clothing", "Coffee", "Crafts", "Spices", "Jewelry"]),
+            "stock": rng.randint(0, 100),
+            "images": [f"/routes/products/prod-{i}/images/{n}?v={rng.getrandbits(64):016x}"
+                       for n in range(rng.randint(1, 5))],
+            "featured": rng.random() < 0.1,
+            "createdAt": "2026-10-16T09:00:00",
+        }
+        for i in range(count)
+    ]
+
+# The normalization Collection._load applied to products before it moved to write time
+def legacy_normalize(data: List[Dict[str, Any]]) -> None:
+    for product in data:
+        if 'images' in product and not product['images']:
+            product['images'] = []
+        elif 'images' in product and not isinstance(product['images'], list):
+            product['images'] = []
+        if 'images' in product:
+            product['images'] = [img for img in product['images'] if img]
+
+# Best-of-N wall time in milliseconds
+def best_ms(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    try:
+        codec = get_codec(ORJSON_CODEC)
+    except RuntimeError:
+        codec = get_codec(JSON_CODEC)
+
+    print(f"{'products':>8} {'read-time ms':>13} {'as stored ms':>13} {'saved':>7}")
+    for size in SIZES:
+        payload = codec.dumps(make_products(size))
+        before = best_ms(lambda: legacy_normalize(codec.loads(payload)))
+        after = best_ms(lambda: codec.loads(payload))
+        print(f"{size:>8} {before:>13.1f} {after:>13.1f} {(before - after) / before:>7.0%}")
+
+if __name__ == "__main__":
+    main()
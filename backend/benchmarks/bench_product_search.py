@@ -0,0 +1,68 @@
+"""Benchmark product search
+
+Compares the substring scan ProductCollection.search used to run over every
+product's name and description against a lookup in the inverted TextIndex, at
+1k, 10k and 50k products. Run from the backend directory:
+
+    python -m benchmarks.bench_product_search
+"""
+import random
+import time
+from typing import List, Dict, Any
+
+from app.apis.database import TextIndex, ProductCollection
+
+SIZES = [1_000, 10_000, 50_000]
+REPEATS = 20
+QUERIES = ["coffee", "handwoven scarf", "yirga", "berbere spice"]
+WORDS = ["coffee", "scarf", "handwoven", "cotton", "spice", "berbere", "mitmita", "basket",
+         "leather", "silver", "cross", "yirgacheffe", "sidamo", "roasted", "honey", "incense"]
+# Catalog text draws mostly on a larger vocabulary, so each query term is in a small share of products
+SYLLABLES = ["ba", "ke", "lo", "mi", "ne", "ra", "si", "ta", "wu", "ze", "ha", "do"]
+VOCABULARY = WORDS + [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+
+# Generate products resembling the catalog
+def make_products(count: int) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    return [
+        {
+            "id": f"prod-{i}",
+            "name": " ".join(rng.sample(VOCABULARY, 2)).title() + f" {i}",
+            "description": " ".join(rng.choices(VOCABULARY, k=12)),
+            "brand": rng.choice(["Ahadu", "Habesha", "Sheba", "Lalibela"]),
+            "category": rng.choice(["Clothing", "Coffee", "Crafts", "Spices", "Jewelry"]),
+            "supplierName": f"Supplier {rng.randint(1, 50)}",
+        }
+        for i in range(count)
+    ]
+
+# The scan ProductCollection.search ran before the text index
+def legacy_search(data: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+    query = query.lower()
+    return [product for product in data
+            if query in product.get('name', '').lower() or query in product.get('description', '').lower()]
+
+# Best-of-N wall time in milliseconds
+def best_ms(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    print(f"{'products':>8} {'scan ms':>9} {'index ms':>9} {'build ms':>9}")
+    for size in SIZES:
+        data = make_products(size)
+        start = time.perf_counter()
+        index = TextIndex(ProductCollection.text_fields)
+        for product in data:
+            index.add(product["id"], product)
+        build = (time.perf_counter() - start) * 1000
+        scan = best_ms(lambda: [legacy_search(data, query) for query in QUERIES])
+        lookup = best_ms(lambda: [index.search(query) for query in QUERIES])
+        print(f"{size:>8} {scan:>9.2f} {lookup:>9.2f} {build:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Shared fixtures: each storage engine on a fresh, private store
+
+Collections open their store from the active backend when constructed, so tests
+create their collections after requesting one of these fixtures.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "test.sqlite3"))
+
+import pytest
+
+from app.apis import database, storage
+
+class MemoryStorage:
+    """In-memory stand-in for db.storage.text / db.storage.binary"""
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key, default=None):
+        if key in self.values:
+            return self.values[key]
+        if default is None:
+            raise FileNotFoundError(key)
+        return default
+
+    def put(self, key, value):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+@pytest.fixture(autouse=True)
+def no_background_flush(monkeypatch):
+    """Keep counter flush timers from firing mid-test; tests flush explicitly"""
+    monkeypatch.setattr(database, "COUNTER_FLUSH_INTERVAL", 3600.0)
+
+@pytest.fixture
+def databutton_storage(monkeypatch):
+    """Databutton backend over in-memory text and binary storage"""
+    text, binary = MemoryStorage(), MemoryStorage()
+    monkeypatch.setattr(storage.db.storage, "text", text)
+    monkeypatch.setattr(storage.db.storage, "binary", binary)
+    monkeypatch.setattr(storage, "_backend", storage.DatabuttonStorageBackend())
+    return text, binary
+
+@pytest.fixture
+def sqlite_storage(monkeypatch, tmp_path):
+    """SQLite backend on a fresh database file"""
+    backend = storage.SQLiteStorageBackend(str(tmp_path / "test.sqlite3"))
+    monkeypatch.setattr(storage, "_backend", backend)
+    yield backend
+    backend.conn.close()
+
+@pytest.fixture(params=["databutton", "sqlite"])
+def any_storage(request):
+    """Each storage backend in turn"""
+    return request.getfixturevalue(f"{request.param}_storage")
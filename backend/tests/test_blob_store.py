@@ -0,0 +1,106 @@
+"""Tests for the Databutton blob store: log replay, compaction and reading older formats"""
+import gzip
+import json
+
+import pytest
+
+from app.apis.database import Collection
+from app.apis.storage import (
+    BlobCollectionStore, GenerationConflict, GZIP_COMPRESSION, JSON_CODEC, LOG_MODE, MSGPACK_CODEC,
+    NO_COMPRESSION, SNAPSHOT_MODE, get_storage_backend,
+)
+
+def log_collection(name: str = "orders", **kwargs) -> Collection:
+    return Collection(name, storage_mode=LOG_MODE, **kwargs)
+
+def test_log_mode_appends_mutations_and_replays_them(databutton_storage):
+    text, _ = databutton_storage
+    orders = log_collection()
+    orders.save_all([{"id": "o1", "status": "pending"}])
+    orders.add({"id": "o2", "status": "pending"})
+    orders.update("o1", {"status": "shipped"})
+    orders.increment("o2", "reminders")
+    assert orders.flush_increments()
+    assert orders.delete("o2")
+    assert len(text.get("orders.log").splitlines()) == 4
+    assert json.loads(text.get("orders")) == [{"id": "o1", "status": "pending"}]
+    assert log_collection().get_all() == [{"id": "o1", "status": "shipped"}]
+
+def test_log_mode_reload_after_compaction(databutton_storage):
+    text, _ = databutton_storage
+    orders = log_collection()
+    orders.bulk_add([{"id": "o1", "n": 1}, {"id": "o2", "n": 2}])
+    orders.update("o2", {"n": 3})
+    assert orders.compact()
+    assert text.get("orders.log") == ""
+    assert "compaction" not in json.loads(text.get("orders.meta"))
+    assert log_collection().get_all() == [{"id": "o1", "n": 1}, {"id": "o2", "n": 3}]
+    orders.add({"id": "o3", "n": 4})
+    assert log_collection().get_all() == [{"id": "o1", "n": 1}, {"id": "o2", "n": 3}, {"id": "o3", "n": 4}]
+
+def test_crash_before_the_log_is_cleared_does_not_replay_it_twice(databutton_storage, monkeypatch):
+    text, _ = databutton_storage
+    orders = log_collection()
+    orders.add({"id": "o1"})
+    orders.add({"id": "o2"})
+    put = text.put
+    def crash_on_log_clear(key, value):
+        if key == "orders.log" and value == "":
+            raise OSError("worker stopped")
+        put(key, value)
+    monkeypatch.setattr(text, "put", crash_on_log_clear)
+    assert not orders.compact()
+    monkeypatch.setattr(text, "put", put)
+    assert len(text.get("orders.log").splitlines()) == 2
+    reloaded = log_collection()
+    assert [doc["id"] for doc in reloaded.get_all()] == ["o1", "o2"]
+    reloaded.add({"id": "o3"})
+    assert [doc["id"] for doc in log_collection().get_all()] == ["o1", "o2", "o3"]
+    assert reloaded.compact()
+    assert [doc["id"] for doc in log_collection().get_all()] == ["o1", "o2", "o3"]
+
+def test_crash_before_the_snapshot_is_written_keeps_the_log(databutton_storage, monkeypatch):
+    _, binary = databutton_storage
+    orders = log_collection(compression=GZIP_COMPRESSION)
+    orders.add({"id": "o1"})
+    orders.add({"id": "o2"})
+    put = binary.put
+    def crash(key, value):
+        raise OSError("worker stopped")
+    monkeypatch.setattr(binary, "put", crash)
+    assert not orders.compact()
+    monkeypatch.setattr(binary, "put", put)
+    assert [doc["id"] for doc in log_collection().get_all()] == ["o1", "o2"]
+
+def test_reads_legacy_keys_without_meta(databutton_storage):
+    text, _ = databutton_storage
+    text.put("legacy", json.dumps([{"id": "a"}, {"id": "b"}]))
+    assert Collection("legacy").get_by_id("b") == {"id": "b"}
+    store = get_storage_backend().open("legacy")
+    version = store.version()
+    assert version.startswith("sha1-") and version == store.version()
+    text.put("legacy", json.dumps([{"id": "a"}]))
+    assert store.version() != version
+
+def test_compressed_snapshot_reads_back_after_a_codec_change(databutton_storage):
+    text, binary = databutton_storage
+    Collection("products", compression=GZIP_COMPRESSION).save_all([{"id": "p1", "name": "Teff"}])
+    assert json.loads(gzip.decompress(binary.get("products.bin"))) == [{"id": "p1", "name": "Teff"}]
+    assert text.get("products", default="") == ""
+    products = Collection("products", codec=JSON_CODEC, compression=NO_COMPRESSION)
+    assert products.get_all() == [{"id": "p1", "name": "Teff"}]
+    products.add({"id": "p2"})
+    assert json.loads(text.get("products")) == [{"id": "p1", "name": "Teff"}, {"id": "p2"}]
+    assert Collection("products", compression=GZIP_COMPRESSION).get_all() == [{"id": "p1", "name": "Teff"}, {"id": "p2"}]
+
+def test_msgpack_snapshot_reads_back(databutton_storage):
+    pytest.importorskip("msgpack")
+    Collection("products", codec=MSGPACK_CODEC).save_all([{"id": "p1", "price": 12.5}])
+    assert Collection("products").get_all() == [{"id": "p1", "price": 12.5}]
+
+def test_stale_write_is_rejected(databutton_storage):
+    store = BlobCollectionStore("carts", SNAPSHOT_MODE)
+    generation = store.write([{"id": "c1"}])
+    store.write([{"id": "c1"}, {"id": "c2"}], [{"op": "add", "doc": {"id": "c2"}}], generation)
+    with pytest.raises(GenerationConflict):
+        store.write([{"id": "c1"}], [{"op": "delete", "id": "c2"}], generation)
@@ -0,0 +1,98 @@
+"""Tests for collection writes: conflict retries, units of work and counter flushes"""
+import pytest
+
+from app.apis.database import Collection, CollectionWriteError
+from app.apis.storage import LOG_MODE
+
+def interleave(collection: Collection, competing_write) -> None:
+    """Run competing_write just before the collection's next store write, as another worker would"""
+    write = collection._store.write
+    def racing_write(*args, **kwargs):
+        collection._store.write = write
+        competing_write()
+        return write(*args, **kwargs)
+    collection._store.write = racing_write
+
+def test_racing_adds_keep_both_documents(any_storage):
+    first, second = Collection("race"), Collection("race")
+    assert first.get_all() == [] and second.get_all() == []
+    interleave(second, lambda: first.add({"id": "a"}))
+    assert second.add({"id": "b"})
+    assert [doc["id"] for doc in second.get_all()] == ["a", "b"]
+    assert [doc["id"] for doc in first.get_all()] == ["a", "b"]
+    assert second.get_by_id("a") == {"id": "a"}
+
+def test_racing_increments_are_summed(any_storage):
+    first, second = Collection("counters"), Collection("counters")
+    first.add({"id": "p", "views": 0})
+    first.increment("p", "views", 1)
+    second.increment("p", "views", 2)
+    assert first.flush_increments()
+    assert second.flush_increments()
+    interleave(first, lambda: (second.increment("p", "views", 4), second.flush_increments()))
+    assert first.update("p", {"name": "Teff"})
+    assert Collection("counters").get_by_id("p") == {"id": "p", "views": 7, "name": "Teff"}
+
+def test_pending_increments_are_visible_before_flush(any_storage):
+    counters = Collection("counters")
+    counters.add({"id": "p"})
+    assert counters.increment("p", "views")
+    assert counters.increment("p", "views", 2)
+    assert not counters.increment("missing", "views")
+    assert counters.get_by_id("p") == {"id": "p", "views": 3}
+    assert Collection("counters").get_by_id("p") == {"id": "p"}
+    assert counters.flush_increments()
+    assert Collection("counters").get_by_id("p") == {"id": "p", "views": 3}
+
+def test_increments_go_out_with_the_next_write(any_storage):
+    counters = Collection("counters")
+    counters.bulk_add([{"id": "p"}, {"id": "q"}])
+    counters.bulk_increment({"p": {"views": 2}, "q": {"views": 1, "sold": 1}})
+    counters.add({"id": "r"})
+    assert counters.cache_stats()["pendingIncrements"] == 0
+    assert Collection("counters").get_many(["p", "q"]) == {
+        "p": {"id": "p", "views": 2}, "q": {"id": "q", "views": 1, "sold": 1}}
+
+def test_unit_of_work_commits_once(any_storage):
+    carts = Collection("carts")
+    carts.add({"id": "c1", "items": 0})
+    writes = []
+    write = carts._store.write
+    carts._store.write = lambda *args, **kwargs: writes.append(args) or write(*args, **kwargs)
+    with carts.unit_of_work():
+        carts.add({"id": "c2", "items": 0})
+        carts.update("c1", {"items": 2})
+        carts.increment("c2", "items")
+        assert Collection("carts").get_all() == [{"id": "c1", "items": 0}]
+    assert len(writes) == 1
+    assert Collection("carts").get_all() == [{"id": "c1", "items": 2}, {"id": "c2", "items": 1}]
+
+def test_unit_of_work_rolls_back_when_the_block_raises(any_storage):
+    carts = Collection("carts")
+    carts.add({"id": "c1", "items": 0})
+    with pytest.raises(RuntimeError):
+        with carts.unit_of_work():
+            carts.update("c1", {"items": 5})
+            carts.add({"id": "c2"})
+            raise RuntimeError("payment failed")
+    assert carts.get_all() == [{"id": "c1", "items": 0}]
+    assert Collection("carts").get_all() == [{"id": "c1", "items": 0}]
+
+def test_unit_of_work_raises_when_the_commit_fails(any_storage):
+    carts = Collection("carts")
+    carts.add({"id": "c1"})
+    def fail(*args, **kwargs):
+        raise OSError("storage unavailable")
+    carts._store.write = fail
+    with pytest.raises(CollectionWriteError):
+        with carts.unit_of_work():
+            carts.add({"id": "c2"})
+    assert Collection("carts").get_all() == [{"id": "c1"}]
+
+def test_same_id_adds_survive_reload_in_log_mode(databutton_storage):
+    orders = Collection("orders", storage_mode=LOG_MODE)
+    orders.add({"id": "ord-1", "total": 10})
+    orders.add({"id": "ord-1", "total": 20})
+    assert [doc["total"] for doc in Collection("orders", storage_mode=LOG_MODE).get_all()] == [10, 20]
+    assert orders.compact()
+    assert [doc["total"] for doc in Collection("orders", storage_mode=LOG_MODE).get_all()] == [10, 20]
@@ -0,0 +1,80 @@
+"""Tests for merging the legacy order keys into the orders collection"""
+from app.apis.database import OrderCollection, OrderConsolidationCollection
+from app.apis.storage import get_storage_backend
+
+def make_order(id: str, status: str = "pending", updated_at: str = "", **fields):
+    order = {
+        "id": id,
+        "items": [{"productId": "prod-1", "name": "Teff Flour", "price": 120.0, "image": "",
+                   "quantity": 1, "category": "Grains"}],
+        "totalAmount": 120.0,
+        "shippingInfo": {"fullName": "Abebe Kebede", "email": "abebe@example.com", "phone": "0911 223 344",
+                         "address": "Bole Road", "city": "Addis Ababa", "state": "Addis Ababa",
+                         "zipCode": "1000", "country": "Ethiopia"},
+        "paymentMethod": "bank_transfer",
+        "status": status,
+        "createdAt": "2024-01-01T00:00:00",
+        **fields,
+    }
+    if updated_at:
+        order["updatedAt"] = updated_at
+    return order
+
+def put_legacy(key: str, orders) -> None:
+    get_storage_backend().open(key).write(orders)
+
+def make_consolidation():
+    orders = OrderCollection("orders")
+    return orders, OrderConsolidationCollection("order_consolidation", orders, ["all_orders", "orders_backup"])
+
+def test_consolidation_merges_keys_and_advances_watermarks(sqlite_storage):
+    put_legacy("all_orders", [make_order("o1"), make_order("o2")])
+    put_legacy("orders_backup", [make_order("o2", "shipped", "2024-02-01T00:00:00")])
+    orders, consolidation = make_consolidation()
+    result = consolidation.consolidate()
+    assert result["added"] == 2
+    assert orders.get_by_id("o1")["items"][0]["id"] == "prod-1"
+    assert orders.get_by_id("o2")["status"] == "shipped"
+    for key in ["all_orders", "orders_backup"]:
+        watermark = consolidation.get_by_id(key)
+        assert watermark["generation"] == get_storage_backend().open(key).version()
+        assert consolidation.is_consolidated(key, watermark["generation"])
+    assert consolidation.consolidate()["sources"] == {"all_orders": {"skipped": True},
+                                                      "orders_backup": {"skipped": True}}
+
+def test_changed_keys_are_consolidated_again(sqlite_storage):
+    put_legacy("all_orders", [make_order("o1")])
+    orders, consolidation = make_consolidation()
+    consolidation.consolidate()
+    put_legacy("all_orders", [make_order("o1", "delivered", "2024-03-01T00:00:00"), make_order("o3")])
+    result = consolidation.consolidate()
+    assert (result["added"], result["updated"]) == (1, 1)
+    assert result["sources"]["orders_backup"] == {"skipped": True}
+    assert orders.get_by_id("o1")["status"] == "delivered"
+    assert consolidation.get_by_id("all_orders")["orders"] == 2
+
+def test_newer_collection_copies_are_kept(sqlite_storage):
+    orders, consolidation = make_consolidation()
+    orders.add(make_order("o1", "delivered", "2024-05-01T00:00:00"))
+    put_legacy("all_orders", [make_order("o1", "pending", "2024-01-02T00:00:00")])
+    consolidation.consolidate()
+    assert orders.get_by_id("o1")["status"] == "delivered"
+
+def test_invalid_orders_are_skipped_and_keep_the_key_unconsolidated(sqlite_storage):
+    put_legacy("all_orders", [make_order("o1"), {"id": "broken", "status": "pending"}])
+    orders, consolidation = make_consolidation()
+    result = consolidation.consolidate()
+    assert result["sources"]["all_orders"] == {"orders": 1, "invalid": ["broken"]}
+    assert orders.get_by_id("o1") is not None and orders.get_by_id("broken") is None
+    assert consolidation.get_by_id("all_orders") is None
+    assert "skipped" not in consolidation.consolidate()["sources"]["all_orders"]
+
+def test_orders_without_an_id_are_not_duplicated(sqlite_storage):
+    anonymous = make_order("")
+    del anonymous["id"]
+    put_legacy("all_orders", [anonymous])
+    orders, consolidation = make_consolidation()
+    consolidation.consolidate()
+    put_legacy("all_orders", [anonymous, make_order("o2")])
+    consolidation.consolidate()
+    assert sorted(order["id"].startswith("ord-legacy-") for order in orders.get_all()) == [False, True]
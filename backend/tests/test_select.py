@@ -0,0 +1,97 @@
+"""Tests for planned queries: select against a brute-force scan, and cursor paging"""
+import random
+
+import pytest
+
+from app.apis.database import ProductCollection, encode_cursor
+
+CATEGORIES = ["Coffee", "Spices", "Crafts", "Clothing"]
+
+def make_products(count: int = 300):
+    rng = random.Random(7)
+    return [{
+        "id": f"prod-{i:04d}",
+        "name": f"Product {rng.randint(1, 50)}",
+        "category": rng.choice(CATEGORIES),
+        "supplierId": f"sup-{rng.randint(1, 8)}",
+        "featured": rng.random() < 0.2,
+        "price": rng.randint(1, 40) * 25,
+        "rating": rng.randint(0, 5),
+        "createdAt": f"2024-01-{rng.randint(1, 28):02d}",
+    } for i in range(count)]
+
+def brute_force(collection, data, where, ranges, sort_by, descending):
+    fields = {"category": "category", "supplier_id": "supplierId", "featured": "featured"}
+    matches = [doc for doc in data
+               if all(doc[fields[name]] == value for name, value in where.items())
+               and all((low is None or collection.sort_keys[name](doc) >= low)
+                       and (high is None or collection.sort_keys[name](doc) <= high)
+                       for name, (low, high) in ranges.items())]
+    key = collection.sort_keys[sort_by]
+    return [doc["id"] for doc in sorted(matches, key=lambda doc: (key(doc), doc["id"]), reverse=descending)]
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_select_matches_a_brute_force_scan(sqlite_storage, columnar):
+    data = make_products()
+    products = ProductCollection("products", columnar=columnar)
+    products.save_all(data)
+    rng = random.Random(11)
+    for _ in range(300):
+        where = {}
+        if rng.random() < 0.6:
+            where["category"] = rng.choice(CATEGORIES)
+        if rng.random() < 0.3:
+            where["featured"] = rng.choice([True, False])
+        if rng.random() < 0.2:
+            where["supplier_id"] = f"sup-{rng.randint(1, 8)}"
+        ranges = {}
+        if rng.random() < 0.4:
+            ranges[rng.choice(["price", "rating"])] = (rng.choice([None, 100, 300]), rng.choice([None, 500, 800]))
+        sort_by = rng.choice(["price", "rating", "name", "createdAt"])
+        descending = rng.random() < 0.5
+        offset, limit, count = rng.choice([0, 0, 5, 40]), rng.choice([1, 10, None]), rng.random() < 0.5
+        expected = brute_force(products, data, where, ranges, sort_by, descending)
+        result = products.select(where=where, ranges=ranges, sort_by=sort_by, descending=descending,
+                                 offset=offset, limit=limit, count=count)
+        end = None if limit is None else offset + limit
+        assert [doc["id"] for doc in result.items] == expected[offset:end]
+        assert result.total == (len(expected) if count else None)
+
+def test_cursor_pages_walk_every_match_once(sqlite_storage):
+    data = make_products()
+    products = ProductCollection("products")
+    products.save_all(data)
+    for sort_by in ["price", "name", "createdAt"]:
+        for descending in [False, True]:
+            where = {"category": "Coffee"}
+            seen, cursor = [], ""
+            while cursor is not None:
+                page = products.select(where=where, sort_by=sort_by, descending=descending,
+                                       limit=7, cursor=cursor, count=False)
+                assert len(page.items) <= 7
+                seen += [doc["id"] for doc in page.items]
+                cursor = page.next_cursor
+            assert seen == brute_force(products, data, where, {}, sort_by, descending)
+
+def test_cursor_pages_do_not_shift_when_documents_are_added(sqlite_storage):
+    products = ProductCollection("products")
+    products.save_all([{"id": f"p{i}", "price": i * 10} for i in range(6)])
+    first = products.select(sort_by="price", limit=3, cursor="")
+    assert [doc["id"] for doc in first.items] == ["p0", "p1", "p2"]
+    products.add({"id": "cheap", "price": 5})
+    second = products.select(sort_by="price", limit=3, cursor=first.next_cursor)
+    assert [doc["id"] for doc in second.items] == ["p3", "p4", "p5"]
+    assert second.next_cursor is None
+
+def test_invalid_cursors_raise_value_error(sqlite_storage):
+    products = ProductCollection("products")
+    products.save_all([{"id": f"p{i}", "price": i, "name": f"p{i}"} for i in range(4)])
+    by_name = products.select(sort_by="name", limit=2, cursor="").next_cursor
+    with pytest.raises(ValueError):
+        products.select(sort_by="price", limit=2, cursor=by_name)
+    with pytest.raises(ValueError):
+        products.select(sort_by="price", limit=2, cursor=encode_cursor("price", "not a number", "p1"))
+    with pytest.raises(ValueError):
+        products.select(sort_by="price", limit=2, cursor="garbage")
+    with pytest.raises(ValueError):
+        products.select(sort_by=lambda product: product["price"], cursor="")
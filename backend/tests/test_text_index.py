@@ -0,0 +1,34 @@
+"""Tests for the full-text index behind product search
+
+Run from the backend directory:
+
+    python -m pytest tests
+"""
+import os
+import tempfile
+
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.mkdtemp(), "test.sqlite3"))
+
+from app.apis.database import TextIndex, ProductCollection
+
+PRODUCTS = [
+    {"id": "prod-1", "name": "Injera Basket", "description": "Handwoven basket for injera"},
+    {"id": "prod-2", "name": "Teff Flour", "description": "Brown teff flour"},
+    {"id": "prod-3", "name": "Red Teff", "description": "Red teff grain"},
+]
+
+def make_index() -> TextIndex:
+    index = TextIndex(ProductCollection.text_fields)
+    for product in PRODUCTS:
+        index.add(product["id"], product)
+    return index
+
+def test_multi_term_query_matches_documents_with_every_term():
+    assert set(make_index().search("red tef")) == {"prod-3"}
+
+def test_multi_term_query_with_unknown_term_matches_nothing():
+    index = make_index()
+    assert index.search("injera teff") == {}
+    assert index.search("unknown teff") == {}
+    assert index.search("teff unknown") == {}
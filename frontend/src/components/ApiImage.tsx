@@ -0,0 +1,73 @@
+import React, { useEffect, useState } from 'react';
+import { auth } from '../app/auth';
+import { API_ROUTE_PREFIX, resolveApiRoute } from '../utils/imageUtils';
+
+interface ApiImageProps extends Omit<React.ImgHTMLAttributes<HTMLImageElement>, 'src'> {
+  src: string;
+}
+
+/**
+ * Image served by an authenticated API route, such as an order's payment proof.
+ * A plain <img> cannot send the auth header, so the image is fetched through the
+ * API and shown from an object URL. Other sources are rendered as they are.
+ */
+export function ApiImage({ src, alt, ...props }: ApiImageProps) {
+  const isRoute = src.startsWith(API_ROUTE_PREFIX);
+  const [objectUrl, setObjectUrl] = useState<string | null>(null);
+  const [isPdf, setIsPdf] = useState(false);
+  const [failed, setFailed] = useState(false);
+
+  useEffect(() => {
+    if (!isRoute) return;
+    let cancelled = false;
+    let url: string | null = null;
+    setObjectUrl(null);
+    setFailed(false);
+
+    const load = async () => {
+      try {
+        const authHeader = await auth.getAuthHeaderValue();
+        const response = await fetch(resolveApiRoute(src), {
+          credentials: 'include',
+          headers: authHeader ? { Authorization: authHeader } : {},
+        });
+        if (!response.ok) {
+          throw new Error(`HTTP ${response.status}`);
+        }
+        const blob = await response.blob();
+        if (cancelled) return;
+        url = URL.createObjectURL(blob);
+        setIsPdf(blob.type === 'application/pdf');
+        setObjectUrl(url);
+      } catch (error) {
+        console.error(`Error loading image ${src}:`, error);
+        if (!cancelled) setFailed(true);
+      }
+    };
+    load();
+
+    return () => {
+      cancelled = true;
+      if (url) URL.revokeObjectURL(url);
+    };
+  }, [src, isRoute]);
+
+  if (!isRoute) {
+    return <img src={src} alt={alt} {...props} />;
+  }
+  if (failed) {
+    return <p className="p-4 text-sm text-gray-500">Could not load {alt || 'image'}</p>;
+  }
+  if (!objectUrl) {
+    return <div className="h-24 w-full animate-pulse bg-gray-100" />;
+  }
+  if (isPdf) {
+    // Payment proofs may be PDFs, which an <img> cannot show
+    return (
+      <a href={objectUrl} target="_blank" rel="noopener noreferrer" className="block p-4 text-sm text-primary underline">
+        Open {alt || 'document'} (PDF)
+      </a>
+    );
+  }
+  return <img src={objectUrl} alt={alt} {...props} />;
+}
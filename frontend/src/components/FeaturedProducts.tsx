@@ -3,7 +3,7 @@ import { useNavigate } from "react-router-dom";
 import { ProductCardSimple } from "../components/ProductCardSimple";
 import { useProductsStore } from "../utils/productsStore";
 import brain from "brain";
-import { preloadImages, getImageWithFallback } from "../utils/imageUtils";
+import { preloadImages, getImageWithFallback, resolveApiRoute } from "../utils/imageUtils";
 import { toast } from "sonner";
 import { motion } from "framer-motion";
 import { ArrowRight, AlertCircle, ShoppingCart } from "lucide-react";
@@ -34,7 +34,7 @@ export function FeaturedProducts() {
         if (data.products && data.products.length > 0) {
           const apiProducts = data.products.map(apiProduct => {
             const mainImage = apiProduct.images && apiProduct.images.length > 0 ? 
-              apiProduct.images[0] : '';
+              resolveApiRoute(apiProduct.images[0]) : '';
             
             return {
               id: apiProduct.id,
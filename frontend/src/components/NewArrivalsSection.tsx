@@ -2,7 +2,7 @@ import React, { useState, useEffect, useRef } from "react";
 import { useNavigate } from "react-router-dom";
 import { useProductsStore } from "../utils/productsStore";
 import { ProductCardSimple } from "./ProductCardSimple";
-import { preloadImages, getImageWithFallback } from "../utils/imageUtils";
+import { preloadImages, getImageWithFallback, resolveApiRoute } from "../utils/imageUtils";
 import brain from "brain";
 import { ArrowRight, AlertCircle } from "lucide-react";
 
@@ -35,7 +35,7 @@ export function NewArrivalsSection() {
               id: p.id,
               name: p.name,
               price: p.price,
-              image: p.images && p.images.length > 0 ? p.images[0] : '',
+              image: p.images && p.images.length > 0 ? resolveApiRoute(p.images[0]) : '',
               category: p.category,
               description: p.description || '',
               supplierName: p.supplierName || 'Ahadu Market'
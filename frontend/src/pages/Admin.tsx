@@ -14,6 +14,7 @@ import { useProductsStore, Product } from "../utils/productsStore";
 import { useOrderStore, Order } from "../utils/orderStore";
 import { useUserAuth } from "../utils/userAuthStore";
 import { ADMIN_EMAIL } from "../utils/constants";
+import { resolveApiRoute } from "../utils/imageUtils";
 
 // Create or update a notification API endpoint to handle inventory alerts
 const sendInventoryNotification = async (product: Product, message: string) => {
@@ -1255,7 +1256,7 @@ export default function Admin() {
                   {dashboardData.lowStockItems.map((item, index) => (
                     <div key={index} className="flex items-center justify-between p-2 hover:bg-gray-50 rounded-md">
                       <div className="flex items-center">
-                        <img src={item.image} alt={item.name} className="h-8 w-8 rounded object-cover mr-3" />
+                        <img src={resolveApiRoute(item.image)} alt={item.name} className="h-8 w-8 rounded object-cover mr-3" />
                         <div>
                           <p className="text-sm font-medium">{item.name}</p>
                           <p className="text-xs text-gray-500">{item.category}</p>
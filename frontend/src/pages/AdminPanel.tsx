@@ -1,6 +1,8 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import { useNavigate } from 'react-router-dom';
 import AdminSupplierManagement from '../components/AdminSupplierManagement';
+import { ApiImage } from '../components/ApiImage';
+import { resolveApiRoute } from '../utils/imageUtils';
 import { Toaster, toast } from 'sonner';
 import { APP_BASE_PATH } from 'app';
 import brain from '../brain';
@@ -936,7 +938,7 @@ function OrdersTab() {
                       <TableCell>
                         <div className="flex items-center gap-3">
                           <div className="h-10 w-10 rounded-md bg-secondary overflow-hidden">
-                            {item.image && <img src={item.image} alt={item.name} className="h-full w-full object-cover" />}
+                            {item.image && <img src={resolveApiRoute(item.image)} alt={item.name} className="h-full w-full object-cover" />}
                           </div>
                           <div>
                             <p className="font-medium">{item.name}</p>
@@ -1386,7 +1388,7 @@ function OrdersTab() {
                           <TableCell>
                             <div className="flex items-center gap-3">
                               <div className="h-12 w-12 rounded overflow-hidden">
-                                <img src={item.image} alt={item.name} className="h-full w-full object-cover" />
+                                <img src={resolveApiRoute(item.image)} alt={item.name} className="h-full w-full object-cover" />
                               </div>
                               <div>
                                 <p className="font-medium">{item.name}</p>
@@ -1449,7 +1451,7 @@ function OrdersTab() {
                     <div>
                       <p className="text-sm font-medium text-muted-foreground mb-2">Payment Proof</p>
                       <div className="border rounded-md overflow-hidden max-w-sm">
-                        <img src={selectedOrder.paymentProof} alt="Payment proof" className="w-full" />
+                        <ApiImage src={selectedOrder.paymentProof} alt="Payment proof" className="w-full" />
                       </div>
                     </div>
                   )}
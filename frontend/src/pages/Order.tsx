@@ -7,6 +7,7 @@ import { useOrderStore, Order as OrderType } from "../utils/orderStore";
 import { useUserAuth } from "../utils/userAuthStore";
 import { toast } from "sonner";
 import brain from "../brain";
+import { ApiImage } from "../components/ApiImage";
 
 // Format address safely for display
 const formatShippingAddress = (order: Order) => {
@@ -325,7 +326,7 @@ export default function Order() {
                     <div className="mt-4">
                       <p className="text-sm font-medium text-gray-700 mb-2">Payment Proof</p>
                       <div className="border border-gray-200 rounded-md overflow-hidden">
-                        <img src={order.paymentProof} alt="Payment proof" className="w-full h-auto" />
+                        <ApiImage src={order.paymentProof} alt="Payment proof" className="w-full h-auto" />
                       </div>
                     </div>
                   )}
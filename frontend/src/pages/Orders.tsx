@@ -7,6 +7,7 @@ import { useUserAuth } from "../utils/userAuthStore";
 import { useOrderStore, Order as OrderType } from "../utils/orderStore";
 import { toast } from "sonner";
 import brain from "../brain";
+import { resolveApiRoute } from "../utils/imageUtils";
 
 // Format address safely for display
 const formatShippingAddress = (order: Order) => {
@@ -200,7 +201,7 @@ export default function Orders() {
                       <div key={item.id} className="flex items-center gap-3">
                         <div className="h-16 w-16 flex-shrink-0 overflow-hidden rounded-md border border-gray-200">
                           <img
-                            src={item.image}
+                            src={resolveApiRoute(item.image)}
                             alt={item.name}
                             className="h-full w-full object-cover object-center"
                           />
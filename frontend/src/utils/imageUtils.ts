@@ -1,6 +1,19 @@
 /**
  * Image utilities for optimizing image loading and handling image errors
  */
+import brain from '../brain';
+
+// The backend references files it serves itself by route, e.g. /routes/products/prod-1/images/0?v=3f2a
+export const API_ROUTE_PREFIX = '/routes/';
+
+/**
+ * Resolve a route reference returned by the backend against the API base URL.
+ * Other URLs (data URLs, external images) are returned unchanged.
+ */
+export const resolveApiRoute = (src: string): string => {
+  if (!src || !src.startsWith(API_ROUTE_PREFIX)) return src;
+  return `${brain.baseUrl}/${src.slice(API_ROUTE_PREFIX.length)}`;
+};
 
 /**
  * Creates a colored placeholder image with text using data URL
@@ -133,5 +146,5 @@ export const getImageWithFallback = (imageUrl: string, fallbackText = 'No Image'
   if (!imageUrl || typeof imageUrl !== 'string' || imageUrl.trim() === '') {
     return getPlaceholderImage(fallbackText);
   }
-  return imageUrl;
+  return resolveApiRoute(imageUrl);
 };
@@ -1,6 +1,7 @@
 import { create } from 'zustand';
 import { persist } from 'zustand/middleware';
 import brain from '../brain';
+import { resolveApiRoute } from './imageUtils';
 
 // Product interface defines the structure of a product in our store
 export interface Product {
@@ -180,8 +181,8 @@ export const useProductsStore = create<ProductsState>(
             id: apiProduct.id,
             name: apiProduct.name,
             price: apiProduct.price,
-            image: apiProduct.images[0] || '',
-            additionalImages: apiProduct.images.slice(1),
+            image: resolveApiRoute(apiProduct.images[0] || ''),
+            additionalImages: apiProduct.images.slice(1).map(resolveApiRoute),
             category: apiProduct.category,
             description: apiProduct.description,
             stock: apiProduct.stock,
@@ -227,7 +228,9 @@ export const useProductsStore = create<ProductsState>(
             
             if (apiProduct.images && Array.isArray(apiProduct.images)) {
               // Filter out any invalid/empty image URLs
-              const validImages = apiProduct.images.filter(img => img && typeof img === 'string' && img.trim() !== '');
+              const validImages = apiProduct.images
+                .filter(img => img && typeof img === 'string' && img.trim() !== '')
+                .map(resolveApiRoute);
               mainImage = validImages[0] || '';
               additionalImages = validImages.slice(1);
             }
@@ -353,8 +356,8 @@ export const useProductsStore = create<ProductsState>(
             id: data.product.id,
             name: data.product.name,
             price: data.product.price,
-            image: data.product.images[0] || '',
-            additionalImages: data.product.images.slice(1),
+            image: resolveApiRoute(data.product.images[0] || ''),
+            additionalImages: data.product.images.slice(1).map(resolveApiRoute),
             category: data.product.category,
             description: data.product.description,
             colors: productData.colors || [],